@@ -1,19 +1,10 @@
-from flask import Flask, redirect, url_for, jsonify, session
-from flask import render_template
-from flask import request
+from flask import Flask
 import argparse
-import pygal
 import socket
-from timeit import default_timer as timer
+import os
 from wtforms import Form, StringField
 
 import wikineighbors
-from wikineighbors.file_names import get_corpus_size_and_cat
-from wikineighbors.exceptions import WikiNeighborsNoArticlesFound
-from wikineighbors.exceptions import WikiNeighborsNoVocabFound
-from wikineighbors.exceptions import WikiNeighborsNoMemory
-from wikineighbors.exceptions import WikiNeighborsNoSpecs
-from wikineighbors.exceptions import WikiNeighborsMissingW2Dfs
 
 
 class WordInputForm(Form):
@@ -23,248 +14,56 @@ class WordInputForm(Form):
 
 hostname = socket.gethostname()
 
-app = Flask(__name__)
 
+# -------------------------------------------- app factory
 
-# ------------------------------------------------ views
-
-@app.route('/', methods=['GET', 'POST'])
-def home():
-    headers, rows, buttons = make_home_data()  # returns 1 row per corpus not per param_name
-    # sort
-    if rows:
-        header = request.args.get('header') or config.Default.header
-        order = request.args.get('order') or config.Default.order
-        rows = sort_rows(rows, header, order)
-    else:
-        print('Did not find any corpus data.')
-
-    return render_template('home.html',
-                           topbar_dict=topbar_dict,
-                           title='Wikipedia Corpora',
-                           rows=rows,
-                           buttons=buttons,
-                           headers=headers)
-
-
-@app.route('/info/<string:corpus_name>', methods=['GET', 'POST'])
-def info(corpus_name):
-    corpus = Corpus(corpus_name)
-
-    return render_template('info.html',
-                           topbar_dict=topbar_dict,
-                           corpus_name=corpus_name,
-                           num_param_names=corpus.num_param_names,
-                           paths_to_txt_files=corpus.txt_paths
-                           )
-
-
-@app.route('/query/<string:corpus_name>', methods=['GET', 'POST'])
-def query(corpus_name):
-
-    if not session.get(corpus_name):
-        raise WikiNeighborsNoSpecs(corpus_name)
-
-    if request.args.get('reset'):
-        session['error_messages'] = []
-        session['words'] = []  # don't autofill fields with user's previous words
-
-    if not session.get('error_messages', []):
-        error_message = ''
-        fields = [(config.Default.word, error_message)
-                  for _ in range(config.Max.num_fields)]
-    else:
-        fields = [(word, error_message)
-                  for word, error_message in zip(session['words'], session['error_messages'])]
-
-    return render_template('query.html',
-                           topbar_dict=topbar_dict,
-                           corpus_name=corpus_name,
-                           fields=fields,
-                           )
-
-
-@app.route('/build/<string:corpus_name>', methods=['GET', 'POST'])
-def build(corpus_name):
-    corpus = Corpus(corpus_name)
-
-    return render_template('build.html',
-                           topbar_dict=topbar_dict,
-                           corpus_name=corpus_name,
-                           vocab_sizes=config.Sims.vocab_sizes,
-                           w2dfs_names=corpus.w2dfs_names,
-                           cached_vocab_names=corpus.cached_vocab_names,
-                           )
-
-
-@app.route('/neighbors/<string:corpus_name>', methods=['GET', 'POST'])
-def neighbors(corpus_name):
-    start = timer()
-    corpus = Corpus(corpus_name)
-    responder = Responder.load_from_session(session, corpus)
-
-    valid_words = session['validated_words']
-
-    results = []
-    for word in valid_words:
-        sorted_neighbors, sorted_sims = responder.get_neighbors(word)
-        top_neighbors = sorted_neighbors[-config.Max.num_neighbors:][::-1]
-        top_sims = sorted_sims[-config.Max.num_neighbors:][::-1]
-        # chart - will be converted to table
-        chart = pygal.Bar()
-        chart.add('cosine', [s.round(2) for s in top_sims])
-        chart.x_labels = ['{:<20}'.format(n) for n in top_neighbors]
-        table = chart.render_table(style=False)
-        res = (word, table)
-        results.append(res)
-
-    # filtered sim table (sims between all word pairs)
-    chart = pygal.Bar()
-    for word in valid_words:
-        sims = responder.get_sims(word, valid_words)
-        chart.add(word, [s.round(2) for s in sims])
-    chart.x_labels = ['{:<20}'.format(w) for w in valid_words]
-    filtered_sim_table = chart.render_table(style=True)
-
-    elapsed = timer() - start
-    return render_template('neighbors.html',
-                           topbar_dict=topbar_dict,
-                           corpus_name=corpus_name,
-                           words=valid_words,
-                           results=results,
-                           filtered_sim_table=filtered_sim_table,
-                           num_svd_dims=config.Sims.num_svd_dimensions,
-                           num_words=human_format(responder.specs.vocab_size),
-                           num_docs=human_format(responder.specs.corpus_size),
-                           elapsed=elapsed
-                           )
-
-# ----------------------------------------------- non-views
-
-
-@app.route('/autocomplete/<string:corpus_name>', methods=['GET'])
-def autocomplete(corpus_name):
-    corpus = Corpus(corpus_name)
-    responder = Responder.load_from_session(session, corpus)
-    return jsonify(json_list=responder.vocab)
-
-
-@app.route('/validate/<string:corpus_name>', methods=['GET', 'POST'])
-def validate(corpus_name):
-    corpus = Corpus(corpus_name)
-    responder = Responder.load_from_session(session, corpus)
-    err_message = 'Not in vocab'
-
-    words = session['words'] = request.args.getlist('word')
-    session['validated_words'] = []
-    session['error_messages'] = []
-    for n, word in enumerate(words):
-        if word == config.Default.word:
-            session['error_messages'].append('')
-        elif word not in responder.vocab:
-            session['error_messages'].append(err_message)
-        else:
-            session['error_messages'].append('')
-            session['validated_words'].append(word)
-
-    if err_message in session['error_messages']:
-        return redirect(url_for('query', corpus_name=corpus_name))
-    else:
-        return redirect(url_for('neighbors', corpus_name=corpus_name))
-
-
-@app.route('/cache_sims/<string:corpus_name>', methods=['GET', 'POST'])
-def cache_sims(corpus_name):
-
-    # specs for builder
-    vocab_size = request.args.get('vocab_size')
-    w2dfs_name = request.args.get('w2dfs_name')
-
-    # validation
-    if not vocab_size or not w2dfs_name:
-        return render_template('error.html',
-                               message='Incomplete submission',
-                               status_code=500,
-                               topbar_dict=topbar_dict)
-
-    corpus = Corpus(corpus_name)
-    corpus_size, cat = get_corpus_size_and_cat(w2dfs_name)
-    specs = Specs(vocab_size=vocab_size, corpus_size=corpus_size, cat=cat)
-    builder = SimMatBuilder(corpus, specs)
-    builder.build_and_save()  # saves vocab + sim mat
-    return redirect(url_for('build', corpus_name=corpus_name))
-
-
-@app.route('/load_vocab/<string:corpus_name>', methods=['GET', 'POST'])
-def load_vocab(corpus_name):
-
-    vocab_name = request.args.get('vocab_name')
-    if not vocab_name:
-        return render_template('error.html',
-                               message='Incomplete submission',
-                               status_code=500,
-                               topbar_dict=topbar_dict)
-
-    session[corpus_name] = vocab_name
-    return redirect(url_for('build', corpus_name=corpus_name))
-
-# -------------------------------------------- error handling
-
-
-@app.errorhandler(WikiNeighborsNoArticlesFound)
-def handler(exception):
-    return render_template('error.html',
-                           message=exception.message,
-                           status_code=500,
-                           topbar_dict=topbar_dict)
-
-
-@app.errorhandler(WikiNeighborsNoVocabFound)
-def handler(exception):
-    return render_template('error.html',
-                           message=exception.message,
-                           status_code=500,
-                           topbar_dict=topbar_dict)
-
-
-@app.errorhandler(WikiNeighborsNoMemory)
-def handler(exception):
-    return render_template('error.html',
-                           message=exception.message,
-                           status_code=500,
-                           topbar_dict=topbar_dict)
-
-
-@app.errorhandler(WikiNeighborsNoSpecs)
-def handler(exception):
-    return render_template('error.html',
-                           message=exception.message,
-                           status_code=500,
-                           topbar_dict=topbar_dict)
-
-
-@app.errorhandler(WikiNeighborsMissingW2Dfs)
-def handler(exception):
-    return render_template('error.html',
-                           message=exception.message,
-                           status_code=500,
-                           topbar_dict=topbar_dict)
 
+def create_app(s76=False, preload_models=None):
+    """
+    create app, and the state that it shares across requests, and load models that should be available
+    before the first request.
+    modules are imported here because configuration depends on the s76 flag.
+    call this before worker processes are forked (see serve.py), so that all workers share the loaded models.
+    """
+    if s76:
+        wikineighbors.s76 = True
 
-@app.errorhandler(500)
-def handle_app_error(exception):
-    return render_template('error.html',
-                           message=exception,
-                           status_code=500,
-                           topbar_dict=topbar_dict)
+    # import after setting s76 flag
 
+    from wikineighbors import config
+    from wikineighbors.corpus import Corpus
+    from wikineighbors.registry import ModelRegistry
+    from wikineighbors.results import ResultCache
+    from wikineighbors.jobs import BuildScheduler
+    from wikineighbors.specs import Specs
+    from wikineighbors.metrics import Histogram
+    from wikineighbors.views import bp
 
-@app.errorhandler(404)
-def page_not_found(exception):
-    return render_template('error.html',
-                           message=exception,
-                           status_code=404,
-                           topbar_dict=topbar_dict)
+    app = Flask(__name__)
+    app.secret_key = 'ja0f09'
+    app.config['TOPBAR_DICT'] = {'listing': config.RemoteDirs.ludwig_data,  # points to s76 from local machine or s76
+                                 'hostname': hostname,
+                                 'version': wikineighbors.__version__,
+                                 'title': wikineighbors.__package__.capitalize()
+                                 }
+    registry = ModelRegistry(config.Cache.max_num_model_bytes)
+    app.extensions['wikineighbors'] = {
+        'registry': registry,
+        'result_cache': ResultCache(config.Cache.max_num_results),
+        # records are kept per server (process that creates the app before forking workers)
+        'scheduler': BuildScheduler(config.Jobs.max_num_bytes,
+                                    config.LocalDirs.cache / config.Jobs.dir_name / str(os.getpid())),
+        'request_latency': Histogram('wikineighbors_request_latency_seconds', 'Latency of requests by view',
+                                     label_name='endpoint', buckets=config.Metrics.latency_buckets),
+    }
+    app.register_blueprint(bp)
+
+    # e.g. 'Corpus-1/4000_4800000_NOUN'
+    for model_name in config.Serving.preload_models if preload_models is None else preload_models:
+        corpus_name, vocab_name = model_name.split('/')
+        registry.preload(Corpus(corpus_name), Specs(*vocab_name.split('_')))
+
+    return app
 
 
 # -------------------------------------------- start app from CL
@@ -276,27 +75,9 @@ if __name__ == "__main__":  # pycharm does not use this
                         help='Use this for deployment.')
     parser.add_argument('--s76', action="store_true", default=False, dest='s76',
                         help='If running app on server where Wiki data is stored.')
+    parser.add_argument('--preload', nargs='*', default=None,
+                        help='Models to load before the first request, e.g. Corpus-1/4000_4800000_NOUN.')
     namespace = parser.parse_args()
 
-    if namespace.s76:
-        wikineighbors.s76 = True
-
-    # import after setting s76 flag
-
-    from wikineighbors import config
-    from wikineighbors.io import make_home_data
-    from wikineighbors.utils import sort_rows
-    from wikineighbors.utils import human_format
-    from wikineighbors.corpus import Corpus
-    from wikineighbors.responder import Responder
-    from wikineighbors.builder import SimMatBuilder
-    from wikineighbors.specs import Specs
-
-    topbar_dict = {'listing': config.RemoteDirs.ludwig_data,  # points to s76 from local machine or s76
-                   'hostname': hostname,
-                   'version': wikineighbors.__version__,
-                   'title': wikineighbors.__package__.capitalize()
-                   }
-
-    app.secret_key = 'ja0f09'
+    app = create_app(namespace.s76, namespace.preload)
     app.run(port=5000, debug=namespace.debug, host='0.0.0.0')
@@ -0,0 +1,166 @@
+import argparse
+import shutil
+import json
+import csv
+import os
+import sys
+import socket
+import subprocess
+from pathlib import Path
+
+import wikineighbors
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=Path(__file__).parent, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(records, baseline_path, tolerance, min_wall_time):
+    """
+    print ratio of wall time to baseline for each stage, and return names of stages that regressed.
+    stages faster than min_wall_time are ignored, because their timing is dominated by noise.
+    """
+    with baseline_path.open('r') as f:
+        baseline = {(r['stage'], r['mode']): r['wall_time'] for r in json.load(f)['stages']}
+    regressed = []
+    print(f'{"stage":<24}{"mode":<10}{"baseline":>12}{"current":>12}{"ratio":>8}')
+    for record in records:
+        key = (record['stage'], record['mode'])
+        if key not in baseline:
+            continue
+        ratio = record['wall_time'] / max(baseline[key], 1e-9)
+        flag = ' <-- regression' if ratio > tolerance and record['wall_time'] > min_wall_time else ''
+        print(f'{key[0]:<24}{key[1]:<10}{baseline[key]:>12.4f}{record["wall_time"]:>12.4f}{ratio:>8.2f}{flag}')
+        if flag:
+            regressed.append(key)
+    return regressed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Time every stage of WikiNeighbors on a synthetic corpus.')
+    parser.add_argument('--out', default='benchmark', type=Path,
+                        help='Folder for synthetic corpus, local cache and report.')
+    parser.add_argument('--num_parts', default=4, type=int, help='Number of param_N folders.')
+    parser.add_argument('--num_docs_per_part', default=2500, type=int)
+    parser.add_argument('--doc_size', default=320, type=int, help='Mean number of tokens per document.')
+    parser.add_argument('--num_types', default=20000, type=int, help='Number of distinct words in corpus.')
+    parser.add_argument('--zipf_exponent', default=1.1, type=float)
+    parser.add_argument('--vocab_size', default=4000, type=int)
+    parser.add_argument('--modes', default=['sparse', 'gram', 'dense'], nargs='+',
+                        help='Values of config.Sims.term_doc_mode to benchmark.')
+    parser.add_argument('--shards', action="store_true", default=False,
+                        help='Convert pickle files to memory-mappable shards before building.')
+    parser.add_argument('--neighbor_table', action="store_true", default=False,
+                        help='Build a table of nearest neighbors of each word.')
+    parser.add_argument('--num_queries', default=20, type=int, help='Number of words queried per mode.')
+    parser.add_argument('--regenerate', action="store_true", default=False,
+                        help='Write synthetic corpus even if it already exists.')
+    parser.add_argument('--baseline', default=None, type=Path,
+                        help='Report of a previous run. Exit with non-zero status if a stage is slower.')
+    parser.add_argument('--tolerance', default=1.2, type=float,
+                        help='Maximum ratio of wall time to baseline before a stage counts as a regression.')
+    parser.add_argument('--min_wall_time', default=0.05, type=float,
+                        help='Stages faster than this (in seconds) never count as a regression.')
+    namespace = parser.parse_args()
+
+    out_path = namespace.out.resolve()
+    wiki_runs = out_path / 'ludwig_data' / 'CreateWikiCorpus' / 'runs'
+    cache_path = out_path / 'cache'
+
+    # set before importing config, so that config (also in worker processes) points to synthetic corpus
+    os.environ['WIKINEIGHBORS_LUDWIG_DATA'] = str(out_path / 'ludwig_data')
+    os.environ['WIKINEIGHBORS_CACHE'] = str(cache_path)
+
+    from wikineighbors import config
+    from wikineighbors.synthetic import make_synthetic_corpus
+    from wikineighbors.metrics import BuildReport
+    from wikineighbors.shards import convert_w2dfs
+    from wikineighbors.file_names import to_w2dfs_file_name
+    from wikineighbors.io import make_home_data, home_index
+    from wikineighbors.discovery import discovery_cache
+    from wikineighbors.corpus import Corpus
+    from wikineighbors.builder import SimMatBuilder
+    from wikineighbors.responder import Responder
+    from wikineighbors.specs import Specs
+
+    corpus_size = namespace.num_parts * namespace.num_docs_per_part
+    report = BuildReport(wikineighbors_version=wikineighbors.__version__,
+                         commit=git_commit(),
+                         hostname=socket.gethostname(),
+                         num_jobs=config.Sims.num_jobs,
+                         **{k: v for k, v in vars(namespace).items() if k not in {'out', 'baseline'}})
+
+    # generate
+    if namespace.regenerate or not wiki_runs.exists():
+        if wiki_runs.exists():
+            shutil.rmtree(str(wiki_runs))
+        must_include = (config.LocalDirs.root / config.Sims.must_include_f_name).read_text().split('\n')
+        words = list(dict.fromkeys(must_include + [f'w{i}' for i in range(namespace.num_types)]))
+        with report.measure('generate', mode=''):
+            make_synthetic_corpus(wiki_runs, words, namespace.num_parts, namespace.num_docs_per_part,
+                                  doc_size=namespace.doc_size, zipf_exponent=namespace.zipf_exponent)
+    if cache_path.exists():
+        shutil.rmtree(str(cache_path))  # results are only comparable if nothing is cached
+    if namespace.shards:
+        with report.measure('convert', mode=''):
+            for w2dfs_path in sorted(wiki_runs.glob('param*/' + to_w2dfs_file_name(corpus_size, 'NOUN'))):
+                convert_w2dfs(w2dfs_path, overwrite=True)
+
+    # home page and discovery - first without, then with local index
+    home_index.entries = {}
+    for state in ['cold', 'warm']:
+        with report.measure('make_home_data', mode=state):
+            make_home_data(refresh=state == 'cold')
+    discovery_cache.clear()
+    for state in ['cold', 'warm']:
+        with report.measure('discovery', mode=state):
+            corpus = Corpus('Corpus-1')
+            corpus.param_names, corpus.txt_paths, corpus.w2dfs_names
+
+    # build and query
+    config.NeighborTable.is_built = namespace.neighbor_table
+    specs = Specs(vocab_size=namespace.vocab_size, corpus_size=corpus_size, cat='NOUN')
+    for mode in namespace.modes:
+        config.Sims.term_doc_mode = mode
+        builder = SimMatBuilder(Corpus('Corpus-1'), specs)
+        builder.build_and_save()
+        for record in builder.report.records:
+            report.records.append(dict(record, mode=mode))
+
+        responder = Responder(Corpus('Corpus-1'), specs)
+        with report.measure('responder_load', mode=mode):
+            responder.load()
+            responder.embeddings.sum()  # touch pages, so that time includes reading from disk
+        query_words = responder.vocab.words[:namespace.num_queries].tolist()
+        with report.measure('get_neighbors', mode=mode, num_queries=len(query_words)):
+            for word in query_words:
+                list(responder.get_neighbors(word))
+        with report.measure('get_top_neighbors_batch', mode=mode, num_queries=len(query_words)):
+            responder.get_top_neighbors_batch(query_words, config.Max.num_neighbors)
+
+    for record in report.records:
+        if 'num_queries' in record:
+            record['ms_per_query'] = record['wall_time'] / max(record['num_queries'], 1) * 1000
+
+    # save
+    report_path = out_path / 'report.json'
+    report.save(report_path)
+    fieldnames = ['stage', 'mode', 'vocab_size', 'wall_time', 'cpu_time', 'peak_rss_bytes',
+                  'ms_per_query', 'density', 'docs_per_sec_per_worker']
+    with (out_path / 'report.csv').open('w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(report.records)
+    print(f'Saved report to {report_path} and {report_path.with_suffix(".csv")}')
+
+    for record in report.records:
+        print(f'{record["stage"]:<24}{record["mode"]:<10}{record["wall_time"]:>10.4f}s')
+
+    if namespace.baseline is not None:
+        regressed = compare(report.records, namespace.baseline, namespace.tolerance, namespace.min_wall_time)
+        if regressed:
+            sys.exit(f'{len(regressed)} stages are slower than baseline by more than {namespace.tolerance}x')
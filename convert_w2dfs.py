@@ -0,0 +1,25 @@
+import argparse
+
+import wikineighbors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Convert pickled w2dfs files to memory-mappable shards.')
+    parser.add_argument('--s76', action="store_true", default=False, dest='s76',
+                        help='If running on server where Wiki data is stored.')
+    parser.add_argument('--overwrite', action="store_true", default=False, dest='overwrite',
+                        help='Convert again even if shard already exists.')
+    namespace = parser.parse_args()
+
+    if namespace.s76:
+        wikineighbors.s76 = True
+
+    # import after setting s76 flag
+
+    from wikineighbors import config
+    from wikineighbors.file_names import to_w2dfs_file_name
+    from wikineighbors.shards import convert_w2dfs
+
+    pattern = 'param*/' + to_w2dfs_file_name('*', '*')
+    for w2dfs_path in sorted(config.RemoteDirs.wiki_runs.glob(pattern)):
+        convert_w2dfs(w2dfs_path, overwrite=namespace.overwrite)
@@ -0,0 +1,35 @@
+import argparse
+
+import wikineighbors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compute similarities of many word pairs with a built model.')
+    parser.add_argument('--s76', action="store_true", default=False, dest='s76',
+                        help='If running on server where Wiki data is stored.')
+    parser.add_argument('--corpus_name', required=True, help='e.g. Corpus-1')
+    parser.add_argument('--vocab_name', required=True, help='e.g. 4000_4800000_NOUN')
+    parser.add_argument('--input', default='-', type=argparse.FileType('r'),
+                        help='File with one pair (or list) of words per line. Defaults to stdin.')
+    parser.add_argument('--input_format', default='tsv', choices=['tsv', 'ndjson'])
+    parser.add_argument('--output', default='-', type=argparse.FileType('w'), help='Defaults to stdout.')
+    parser.add_argument('--output_format', default='ndjson', choices=['ndjson', 'csv'])
+    namespace = parser.parse_args()
+
+    if namespace.s76:
+        wikineighbors.s76 = True
+
+    # import after setting s76 flag
+
+    from wikineighbors.corpus import Corpus
+    from wikineighbors.responder import Responder
+    from wikineighbors.specs import Specs
+    from wikineighbors.pairs import iter_pairs, stream_pair_sims, format_pair_sims
+
+    responder = Responder(Corpus(namespace.corpus_name), Specs(*namespace.vocab_name.split('_')))
+    if responder.time_modified is None:
+        raise SystemExit(f'Model {namespace.vocab_name} was not built for {namespace.corpus_name}')
+
+    batches = stream_pair_sims(responder, iter_pairs(namespace.input, namespace.input_format))
+    for chunk in format_pair_sims(batches, namespace.output_format):
+        namespace.output.write(chunk)
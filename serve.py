@@ -0,0 +1,51 @@
+import argparse
+
+from gunicorn.app.base import BaseApplication
+
+import wikineighbors
+
+
+class Server(BaseApplication):
+    """
+    serves an app that was created before gunicorn forks worker processes.
+    models loaded while creating the app are memory-mapped, so all workers share their pages.
+    """
+
+    def __init__(self, application, options):
+        self.application = application
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.application
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve WikiNeighbors with multiple worker processes.')
+    parser.add_argument('--s76', action="store_true", default=False, dest='s76',
+                        help='If running app on server where Wiki data is stored.')
+    parser.add_argument('--num_workers', default=None, type=int,
+                        help='Number of worker processes. Defaults to config.Serving.num_workers.')
+    parser.add_argument('--port', default=None, type=int, help='Defaults to config.Serving.port.')
+    parser.add_argument('--preload', nargs='*', default=None,
+                        help='Models to load before forking workers, e.g. Corpus-1/4000_4800000_NOUN. '
+                             'Defaults to config.Serving.preload_models.')
+    namespace = parser.parse_args()
+
+    if namespace.s76:
+        wikineighbors.s76 = True
+
+    # import after setting s76 flag
+
+    from wikineighbors import config
+    from app import create_app
+
+    options = {'bind': '0.0.0.0:{}'.format(namespace.port or config.Serving.port),
+               'workers': namespace.num_workers or config.Serving.num_workers,
+               'timeout': config.Serving.timeout,
+               'preload_app': True}
+    Server(create_app(namespace.s76, namespace.preload), options).run()
@@ -0,0 +1,127 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.preprocessing import normalize
+from timeit import default_timer as timer
+
+from wikineighbors.utils import to_batch_size
+from wikineighbors import config
+
+
+class IVFIndex:
+    """
+    approximate nearest-neighbor index over L2-normalized embeddings.
+
+    embeddings are partitioned into lists with spherical k-means.
+    a query is only compared to the embeddings in the lists whose centroids are most similar to it.
+    recall increases (and speed decreases) with the number of probed lists.
+    """
+
+    array_names = ('ann_centroids', 'ann_offsets', 'ann_ids')
+
+    def __init__(self, centroids, offsets, ids):
+        self.centroids = centroids
+        self.offsets = offsets  # embeddings in list i are ids[offsets[i]:offsets[i + 1]]
+        self.ids = ids
+
+    @classmethod
+    def build(cls, embeddings, num_lists, num_iterations=config.Ann.num_iterations, seed=0):
+        print(f'Building ANN index with {num_lists} lists...')
+        rng = np.random.default_rng(seed)
+        num_lists = min(num_lists, len(embeddings))
+        centroids = np.array(embeddings[rng.choice(len(embeddings), num_lists, replace=False)])
+        for _ in range(num_iterations):
+            assignments = _assign(embeddings, centroids)
+            # sum embeddings in each list with a sparse matrix multiply
+            membership = csr_matrix((np.ones(len(assignments)), (assignments, np.arange(len(assignments)))),
+                                    shape=(num_lists, len(embeddings)))
+            sums = membership @ embeddings
+            is_empty = np.bincount(assignments, minlength=num_lists) == 0
+            centroids = np.where(is_empty[:, np.newaxis], centroids, normalize(sums))
+
+        assignments = _assign(embeddings, centroids)
+        ids = np.argsort(assignments, kind='stable').astype(np.int32)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=num_lists))])
+        return cls(centroids, offsets, ids)
+
+    def to_arrays(self):
+        return dict(zip(self.array_names, [self.centroids, self.offsets, self.ids]))
+
+    @property
+    def num_bytes(self):
+        return self.centroids.nbytes + self.offsets.nbytes + self.ids.nbytes
+
+    def search(self, embeddings, query_ids, k, num_probes):
+        """
+        return arrays with shape (len(query_ids), k) of approximate nearest neighbors (excluding query itself)
+        and their similarities, sorted from most to least similar
+        """
+        queries = embeddings[query_ids]
+        num_probes = min(num_probes, len(self.centroids))
+        probed = _top_k_2d(queries @ self.centroids.T, num_probes)
+        res_ids = np.zeros((len(query_ids), k), dtype=int)
+        res_sims = np.zeros((len(query_ids), k))
+        for n, (query_id, list_ids) in enumerate(zip(query_ids, probed)):
+            candidates = np.concatenate([self.ids[self.offsets[i]: self.offsets[i + 1]] for i in list_ids])
+            candidates = candidates[candidates != query_id]
+            if len(candidates) < k:  # probed lists are too small - fall back to exact search
+                candidates = np.delete(np.arange(len(embeddings)), query_id)
+            sims = embeddings[candidates] @ queries[n]
+            top = _top_k_2d(sims[np.newaxis, :], k)[0]
+            res_ids[n] = candidates[top]
+            res_sims[n] = sims[top]
+        return res_ids, res_sims
+
+
+def _assign(embeddings, centroids):
+    """
+    return id of most similar centroid for each embedding, computed in batches to bound memory
+    """
+    res = np.zeros(len(embeddings), dtype=np.int64)
+    batch_size = to_batch_size(len(centroids))
+    for start in range(0, len(embeddings), batch_size):
+        batch = embeddings[start: start + batch_size]
+        res[start: start + len(batch)] = np.argmax(batch @ centroids.T, axis=1)
+    return res
+
+
+def _top_k_2d(sims, k):
+    """
+    return column ids of the k largest values in each row, sorted in decreasing order
+    """
+    top_ids = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(sims, top_ids, axis=1), axis=1)
+    return np.take_along_axis(top_ids, order, axis=1)
+
+
+def exact_search(embeddings, query_ids, k):
+    sims = embeddings[query_ids] @ embeddings.T
+    sims[np.arange(len(query_ids)), query_ids] = -np.inf  # exclude query itself
+    return _top_k_2d(sims, k)
+
+
+def evaluate_index(index, embeddings, k, num_probes_list, num_queries, seed=0):
+    """
+    return recall (relative to exact search) and latency for each number of probed lists
+    """
+    rng = np.random.default_rng(seed)
+    query_ids = rng.choice(len(embeddings), min(num_queries, len(embeddings)), replace=False)
+
+    start = timer()
+    batch_size = to_batch_size(len(embeddings))
+    exact_ids = np.concatenate([exact_search(embeddings, query_ids[i: i + batch_size], k)
+                                for i in range(0, len(query_ids), batch_size)])
+    exact_ms = (timer() - start) / len(query_ids) * 1000
+
+    res = []
+    for num_probes in num_probes_list:
+        start = timer()
+        approx_ids, _ = index.search(embeddings, query_ids, k, num_probes)
+        approx_ms = (timer() - start) / len(query_ids) * 1000
+        num_found = sum(len(np.intersect1d(a, e)) for a, e in zip(approx_ids, exact_ids))
+        res.append({'num_probes': num_probes,
+                    'recall': num_found / (len(query_ids) * k),
+                    'ms_per_query': approx_ms,
+                    'exact_ms_per_query': exact_ms})
+        print(f'ANN index with num_probes={num_probes:>4}: recall={res[-1]["recall"]:.3f} '
+              f'ms/query={approx_ms:.3f} (exact={exact_ms:.3f})')
+    return res
@@ -0,0 +1,67 @@
+import attr
+import json
+import numpy as np
+import shutil
+import socket
+import datetime
+
+import wikineighbors
+from wikineighbors.exceptions import WikiNeighborsNoVocabFound
+from wikineighbors.exceptions import WikiNeighborsIncompatibleModel
+from wikineighbors import config
+
+
+def save_model(model_path, arrays, specs, build_info):
+    """
+    save arrays as raw .npy files alongside a JSON manifest.
+    the model is written to a temporary directory first, so that readers never see an incomplete model.
+    """
+    tmp_path = model_path.parent / (model_path.name + '.tmp')
+    if tmp_path.exists():
+        shutil.rmtree(str(tmp_path))
+    tmp_path.mkdir(parents=True)
+
+    manifest = {'version': config.Artifacts.version,
+                'specs': attr.asdict(specs),
+                'arrays': {},
+                'build': dict(build_info,
+                              created=datetime.datetime.now().isoformat(timespec='seconds'),
+                              hostname=socket.gethostname(),
+                              wikineighbors_version=wikineighbors.__version__)}
+    for name, arr in arrays.items():
+        file_name = f'{name}.npy'
+        np.save(tmp_path / file_name, arr)
+        manifest['arrays'][name] = {'file_name': file_name,
+                                    'dtype': arr.dtype.str,
+                                    'shape': list(arr.shape)}
+    with (tmp_path / config.Artifacts.manifest_file_name).open('w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # replace previous model
+    if model_path.exists():
+        shutil.rmtree(str(model_path))
+    tmp_path.rename(model_path)
+    return manifest
+
+
+def load_manifest(model_path):
+    manifest_path = model_path / config.Artifacts.manifest_file_name
+    if not manifest_path.exists():
+        raise WikiNeighborsNoVocabFound(model_path.name)
+    with manifest_path.open('r') as f:
+        manifest = json.load(f)
+    if manifest['version'] != config.Artifacts.version:
+        raise WikiNeighborsIncompatibleModel(model_path, manifest['version'])
+    return manifest
+
+
+def load_array(model_path, manifest, name):
+    """
+    memory-map an array without reading it into memory.
+    pages are shared between processes through the OS page cache.
+    """
+    info = manifest['arrays'][name]
+    res = np.load(model_path / info['file_name'], mmap_mode='r')
+    if res.dtype.str != info['dtype'] or list(res.shape) != info['shape']:
+        raise WikiNeighborsIncompatibleModel(model_path, manifest['version'])
+    return res
@@ -0,0 +1,31 @@
+import os
+
+import wikineighbors
+
+
+def build_and_save(s76, corpus_name, specs, vocab_sizes, plan_dict):
+    """
+    entry point of a build process, which is spawned rather than forked,
+    so that it inherits no threads or locks of the app that started it (e.g. those of gunicorn workers).
+    a spawned process imports everything anew, so configuration is imported only after the s76 flag is set,
+    and the plan is passed as a dict, because un-pickling it would import configuration too early.
+    """
+    wikineighbors.s76 = s76
+
+    # import after setting s76 flag
+
+    from joblib.externals.loky import get_reusable_executor
+    from wikineighbors.corpus import Corpus
+    from wikineighbors.builder import SimMatBuilder
+    from wikineighbors.planner import BuildPlan
+    from wikineighbors import config
+
+    # workers of the build are spawned too, and see only configuration in the environment
+    os.environ.setdefault('WIKINEIGHBORS_LUDWIG_DATA', str(config.RemoteDirs.ludwig_data))
+
+    builder = SimMatBuilder(Corpus(corpus_name), specs, BuildPlan(**plan_dict))
+    try:
+        builder.build_and_save(vocab_sizes)
+    finally:
+        # otherwise, process only exits once idle workers time out, and job appears to be running until then
+        get_reusable_executor().shutdown(wait=True)
@@ -1,89 +1,269 @@
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-import pickle
+import attr
+from sklearn.preprocessing import normalize
 import tempfile
-from joblib import load, dump, Parallel, delayed
+import os
+from contextlib import contextmanager
+from joblib import Parallel, delayed
 from pathlib import Path
 from sklearn.decomposition import TruncatedSVD
 from collections import Counter
 from cached_property import cached_property
-from scipy.sparse import csr_matrix
+from scipy.sparse import csr_matrix, coo_matrix, issparse
+from scipy.linalg import eigh
 import shutil
 from timeit import default_timer as timer
 
 from wikineighbors.exceptions import WikiNeighborsNoMemory
 from wikineighbors.exceptions import WikiNeighborsMissingW2Dfs
-from wikineighbors.file_names import make_cached_file_name
-from wikineighbors.file_names import to_w2dfs_file_name
-from wikineighbors.utils import to_param_path
+from wikineighbors.file_names import make_model_dir_name
+from wikineighbors.artifacts import save_model
+from wikineighbors.file_names import to_w2dfs_file_name, to_w2dfs_shard_name
+from wikineighbors.shards import Shard
+from wikineighbors.ann import IVFIndex, evaluate_index, _top_k_2d
+from wikineighbors.quantization import QuantizedEmbeddings, evaluate_quantization
+from wikineighbors.vocab import Vocab
+from wikineighbors.metrics import BuildReport, measure_worker, summarize_workers
+from wikineighbors.planner import make_plan
+from wikineighbors.staging import ShardStager
+from wikineighbors.checkpoints import Checkpoints, make_fingerprint
+from wikineighbors.utils import to_param_path, is_process_alive, save_json
 from wikineighbors import config
 
 
 class SimMatBuilder:
     """
-    methods for counting words and constructing a similarity matrix.
+    methods for counting words and constructing word embeddings from which similarities are computed.
     """
 
-    def __init__(self, corpus, specs):
+    term_doc_stages = ('counting', 'vocab', 'term-doc')
+    model_stages = ('svd', 'index', 'neighbors', 'save')  # repeated for each vocab size
+    stages = term_doc_stages + model_stages
+
+    def __init__(self, corpus, specs, plan=None):
         self.corpus = corpus
         self.cache_path = config.LocalDirs.cache / corpus.name
         self.specs = specs
-        self.vocab_file_name = make_cached_file_name('vocab', specs)
-        self.sim_mat_file_name = make_cached_file_name('sim_mat', specs)
-
-        # temporary directory for large mem-mapped term-doc matrix
-        for p in Path(tempfile.gettempdir()).glob('wikineighbors*'):
-            print(f'Removing {p}')
-            shutil.rmtree(str(p))
-        temp_dir = Path(tempfile.mkdtemp(prefix='wikineighbors'))
-        self.mmap_path = temp_dir / 'term_doc_mat.mmap'
+        self.model_path = self.cache_path / make_model_dir_name(specs)
+        self.progress_path = self.cache_path / (make_model_dir_name(specs) + '.progress.json')
+        self.stages_done = []
+        self.report_path = self.cache_path / (make_model_dir_name(specs) + '.report.json')
+        self.report = BuildReport(corpus_name=corpus.name,
+                                  vocab_name=make_model_dir_name(specs))
+        self.plan = plan  # made before build, if not provided
+        self.local_w2dfs_paths = None  # staged copies of w2dfs_paths - available after counting
+        self.checkpoints = None  # made before build
+        self.stager = None  # pins staged copies of w2dfs_paths until build is done
+
+        # temporary directory for checkpoints - only created if checkpoints are not kept in cache.
+        # do not remove directories of builds that are still running
+        self.temp_dir = None
+        _remove_stale_temp_dirs()
+
+    def build_and_save(self, vocab_sizes=None):
+        """
+        build and save a model for each vocab size (by default only for the vocab size in specs).
+        the term-by-doc matrix is populated only once for the largest vocab size,
+        and smaller vocabs are derived by slicing rows, which works because vocab is ordered by frequency.
+        """
+        if vocab_sizes is None:
+            vocab_sizes = [self.specs.vocab_size]
+        vocab_sizes = sorted(vocab_sizes, reverse=True)
+        if vocab_sizes[0] != self.specs.vocab_size:
+            raise ValueError('Largest vocab size must be equal to vocab size in specs')
+        self.stages = self.term_doc_stages + self.model_stages * len(vocab_sizes)
+        self.report.info['vocab_sizes'] = vocab_sizes
+
+        # check that build fits into memory before spending hours on it
+        if self.plan is None:
+            self.plan = make_plan(self.specs, self.w2dfs_paths, vocab_sizes)
+        if not self.plan.fits and config.Planner.strict:
+            raise WikiNeighborsNoMemory(self.plan.num_bytes, self.plan.budget_bytes)
+        print(f'Building with term_doc_mode={self.plan.mode} and num_jobs={self.plan.num_jobs} '
+              f'requiring an estimated {self.plan.num_bytes / 1e6} megabytes')
+        self.report.info.update(term_doc_mode=self.plan.mode, num_jobs=self.plan.num_jobs, plan=self.plan.to_dict())
 
-    def build_and_save(self):
-        vocab, sim_mat = self._build()
-        self._save_to_disk(vocab, sim_mat)
-        del vocab
-        del sim_mat
-        shutil.rmtree(str(self.mmap_path.parent))
+        try:
+            self.checkpoints = self._make_checkpoints()
+            vocab, vocab_counts, mat = self._build(vocab_sizes)  # term-by-doc matrix, or its Gram matrix in gram mode
+            for vocab_size in vocab_sizes:
+                specs = attr.evolve(self.specs, vocab_size=vocab_size)
+
+                # make embeddings - similarities are computed on demand by responder
+                with self._stage('svd', vocab_size=vocab_size) as record:
+                    checkpoint_name = f'svd_{vocab_size}'
+                    if self.checkpoints.has(checkpoint_name):
+                        embeddings = self.checkpoints.load(checkpoint_name)[0]['embeddings']
+                        record['is_resumed'] = True
+                    else:
+                        if self.plan.mode == 'gram':
+                            embeddings = self._make_embeddings_from_gram_mat(mat[:vocab_size, :vocab_size])
+                        else:
+                            embeddings = self._make_embeddings(mat[:vocab_size])
+                        self.checkpoints.save(checkpoint_name, {'embeddings': embeddings})
+                arrays = Vocab.build(vocab[:vocab_size], vocab_counts[:vocab_size]).to_arrays()
+                arrays['embeddings'] = embeddings
+                build_info = {}
+
+                # approximate nearest-neighbor index - only useful for large vocabs
+                with self._stage('index', vocab_size=vocab_size):
+                    if vocab_size >= config.Ann.min_vocab_size:
+                        ann_arrays, build_info['ann'] = self._make_ann_index(embeddings)
+                        arrays.update(ann_arrays)
+                    if config.Quantization.dtype is not None:
+                        quantized_arrays, build_info['quantization'] = self._quantize_embeddings(embeddings)
+                        arrays.update(quantized_arrays)
+
+                # table of nearest neighbors of each word - answers the most common request without computation
+                with self._stage('neighbors', vocab_size=vocab_size):
+                    if config.NeighborTable.is_built:
+                        arrays['neighbor_ids'], arrays['neighbor_sims'] = self._make_neighbor_table(embeddings)
+
+                with self._stage('save', vocab_size=vocab_size):
+                    self._save_to_disk(arrays, build_info, specs)
+                del embeddings
+                del arrays
+        except Exception as e:
+            self._write_progress(None, error=repr(e))
+            self.report.save(self.report_path, error=repr(e))
+            raise
+        finally:
+            if self.temp_dir is not None:
+                shutil.rmtree(str(self.temp_dir))
+            if self.stager is not None:
+                self.stager.release()
+        self._write_progress('done')
+        self.report.save(self.report_path)
+        print(f'Saved build report to {self.report_path}')
+        self.checkpoints.remove()  # model is saved
+
+    def _make_checkpoints(self):
+        if config.Checkpoints.is_enabled:
+            path = self.cache_path / (make_model_dir_name(self.specs) + config.Checkpoints.dir_suffix)
+        else:  # checkpoints are still used to pass results of workers, but are removed after build
+            self.temp_dir = Path(tempfile.mkdtemp(prefix=f'wikineighbors_{os.getpid()}_'))
+            path = self.temp_dir / 'checkpoints'
+        res = Checkpoints(path, make_fingerprint(self.specs, self.w2dfs_paths))
+        res.prepare()
+        return res
 
-    def _build(self):
+    def _build(self, vocab_sizes):
+        """
+        the output of each stage is loaded from its checkpoint if a previous build saved it.
+        the matrix is not made if embeddings for all vocab sizes were saved.
+        """
         # make w2cf (word 2 corpus-frequency)
-        w2cf = Counter()
-        chunk_sizes = []
-        for w2dfs_path in self.w2dfs_paths:
-
-            # TODO use joblib to memoize the result of pickle.load so that it can be reused later
-            #  (without being saved in memory)
-
-            with w2dfs_path.open('rb') as f:
-                w2dfs = pickle.load(f)
-            chunk_size = len(w2dfs)
-            print(f'Loaded {chunk_size} w2dfs from {w2dfs_path}')
-            for w2df in w2dfs:
-                w2cf.update(w2df)
-            chunk_sizes.append(chunk_size)
-            del w2dfs  # otherwise twice as much memory is used
-        print(f'Loaded {sum(chunk_sizes)} w2dfs from disk')
+        with self._stage('counting') as record:
+            if self.checkpoints.has('vocab'):  # counts are only needed for making vocab
+                w2cf = None
+                record['is_resumed'] = True
+            elif self.checkpoints.has('counting'):
+                arrays, info = self.checkpoints.load('counting')
+                w2cf = Counter(dict(zip(arrays['words'].tolist(), arrays['counts'].tolist())))
+                record.update(num_types=len(w2cf), is_resumed=True)
+            else:
+                w2cf = self._count_words()
 
         # make vocab
-        vocab = self._make_vocab(w2cf)
-        del w2cf
+        with self._stage('vocab') as record:
+            if self.checkpoints.has('vocab'):
+                arrays, info = self.checkpoints.load('vocab')
+                vocab = arrays['vocab'].tolist()
+                vocab_counts = arrays['vocab_counts'].tolist()
+                record['is_resumed'] = True
+            else:
+                vocab, vocab_counts = self._make_vocab(w2cf)
+                self.checkpoints.save('vocab', {'vocab': np.array(vocab, dtype=str),
+                                                'vocab_counts': np.array(vocab_counts, dtype=np.int64)})
+            del w2cf
+        chunk_sizes = self.checkpoints.load('counting', mmap_mode='r')[1]['chunk_sizes']
 
         # make term-doc mat
-        term_by_doc_mat = self._make_term_by_doc_mat(vocab, chunk_sizes)
+        with self._stage('term-doc') as record:
+            if all(self.checkpoints.has(f'svd_{vocab_size}') for vocab_size in vocab_sizes):
+                mat = None
+                record['is_resumed'] = True
+            elif self.plan.mode == 'gram':
+                mat = self._make_gram_mat(vocab)
+            else:
+                mat = self._make_term_by_doc_mat(vocab, chunk_sizes)
 
-        # make sim mat
-        sim_mat = self._make_sim_mat(term_by_doc_mat)
+        return vocab, vocab_counts, mat
 
-        return vocab, sim_mat
+    def _count_words(self):
+        w2cf = Counter()
+        chunk_sizes = []
+        self.local_w2dfs_paths = []
+        # shards are counted as soon as they are staged, while later shards are still being copied
+        stager, w2dfs_paths = self._stage_w2dfs_paths()
+        for w2dfs_path in w2dfs_paths:
+            shard = Shard.load(w2dfs_path)
+            chunk_size = shard.num_docs
+            print(f'Loaded {chunk_size} w2dfs from {w2dfs_path}')
+            w2cf.update(shard.count_words())
+            chunk_sizes.append(chunk_size)
+            self.local_w2dfs_paths.append(w2dfs_path)
+            del shard  # otherwise twice as much memory is used
+        print(f'Loaded {sum(chunk_sizes)} w2dfs from disk')
+        self.report.update(num_docs=sum(chunk_sizes), num_shards=len(chunk_sizes), num_types=len(w2cf),
+                           **(stager.stats() if stager else {}))
+        self.checkpoints.save('counting', {'words': np.array(list(w2cf), dtype=str),
+                                           'counts': np.array(list(w2cf.values()), dtype=np.int64)},
+                              chunk_sizes=chunk_sizes)
+        return w2cf
+
+    def _stage_w2dfs_paths(self):
+        """
+        return stager (or None) and paths of w2dfs on local disk, which are yielded as soon as they are copied
+        """
+        if config.Staging.is_enabled:
+            if self.stager is None:
+                self.stager = ShardStager(config.LocalDirs.cache / config.Staging.dir_name)
+            return self.stager, self.stager.stage(self.w2dfs_paths)
+        else:
+            return None, iter(self.w2dfs_paths)
+
+    def _get_local_w2dfs_paths(self):
+        """
+        counting stage stages shards, unless it was resumed from a checkpoint
+        """
+        if self.local_w2dfs_paths is None:
+            self.local_w2dfs_paths = list(self._stage_w2dfs_paths()[1])
+        return self.local_w2dfs_paths
+
+    @contextmanager
+    def _stage(self, name, **counters):
+        """
+        report progress, and measure resource usage of stage
+        """
+        self._write_progress(name)
+        with self.report.measure(name, **counters) as record:
+            yield record
+        self.stages_done.append(name)
+
+    def _write_progress(self, stage, error=None):
+        """
+        write progress to file, so that it can be read by other processes (e.g. the web app)
+        """
+        progress = {'stage': stage,
+                    'stages': self.stages,
+                    'stages_done': self.stages_done,
+                    'error': error}
+        save_json(self.progress_path, progress)
 
     def _make_vocab(self, w2cf):
+        """
+        return words that must be included, followed by the most frequent words in order of decreasing frequency,
+        and their counts.
+        words are lower-cased, so the count of a word is the sum of the counts of all its casings.
+        """
         print(f'Making vocab with size={self.specs.vocab_size} and cat={self.specs.cat}')
 
         # custom words that must be included
         must_include_list = (config.LocalDirs.root / config.Sims.must_include_f_name).read_text().split('\n')
         print(f'Including {len(must_include_list)} words in vocab from {config.Sims.must_include_f_name}')
 
-        vocab = set(must_include_list)
+        vocab = dict.fromkeys(must_include_list)  # an ordered set
         num_too_big = 0
         for w, f in sorted(w2cf.items(), key=lambda i: i[1], reverse=True):
 
@@ -91,7 +271,7 @@ class SimMatBuilder:
                 num_too_big += 1
                 continue
 
-            vocab.add(w.lower())
+            vocab[w.lower()] = None
 
             if len(vocab) == self.specs.vocab_size:
                 break
@@ -101,21 +281,109 @@ class SimMatBuilder:
         print(f'Final vocab size={len(vocab)}')
         print(f'Excluded {num_too_big} words that had more than {config.Sims.max_word_size} characters')
 
-        return list(vocab)
+        w2cf_lower = Counter()
+        for w, f in w2cf.items():
+            w2cf_lower[w.lower()] += f
+        vocab = list(vocab)
+        return vocab, [w2cf_lower[w] for w in vocab]
 
     def _make_term_by_doc_mat(self, vocab, chunk_sizes):
+        if self.plan.mode == 'dense':
+            return self._make_dense_term_by_doc_mat(vocab, chunk_sizes)
+        elif self.plan.mode == 'sparse':
+            return self._make_sparse_term_by_doc_mat(vocab, chunk_sizes)
+        else:
+            raise AttributeError('Invalid arg to config.Sims.term_doc_mode')
+
+    def _make_sparse_term_by_doc_mat(self, vocab, chunk_sizes):
+        """
+        each worker saves (row, col, count) triplets for its shard as a checkpoint.
+        the dense matrix is never allocated - only non-zero values are collected.
+        """
+        print('Making sparse term-by-doc matrix...')
+        checkpoint_names = [f'sparse_{i}' for i in range(len(chunk_sizes))]
+        todo = [i for i, name in enumerate(checkpoint_names) if not self.checkpoints.has(name)]
+        if todo:
+            w2dfs_paths = self._get_local_w2dfs_paths()
+            Parallel(n_jobs=self.plan.num_jobs)(
+                delayed(_save_term_by_doc_triplets_chunk)(w2dfs_paths[i], vocab, self.checkpoints, checkpoint_names[i])
+                for i in todo
+            )
+        checkpoints = [self.checkpoints.load(name, mmap_mode='r') for name in checkpoint_names]
+        triplets = [arrays for arrays, info in checkpoints]
+        self.report.update(num_shards_resumed=len(chunk_sizes) - len(todo),
+                           **summarize_workers([info['stats'] for arrays, info in checkpoints]))
+
+        # shift column ids of each shard by the number of documents in previous shards
+        col_offsets = np.cumsum([0] + chunk_sizes[:-1])
+        row_ids = np.concatenate([t['rows'] for t in triplets])
+        col_ids = np.concatenate([t['cols'] + offset for t, offset in zip(triplets, col_offsets)])
+        data = np.concatenate([t['counts'] for t in triplets])
+        del triplets
+        del checkpoints
+
+        shape = (len(vocab), sum(chunk_sizes))
+        res = coo_matrix((data, (row_ids, col_ids)), shape=shape).tocsr()
+        print(f'Successfully built sparse matrix with shape={shape} requiring {res.data.nbytes / 1e6} megabytes')
+        self.report.update(density=res.nnz / (shape[0] * shape[1]))
+        return res
 
-        # init matrix, but dump it to file for mem-mapping
+    def _make_gram_mat(self, vocab):
+        """
+        stream shards and accumulate the word-by-word Gram matrix X @ X.T of the term-by-doc matrix X.
+        X is never materialized, and memory is independent of the number of documents.
+        the accumulated matrix is saved as a checkpoint at intervals, together with the shards summed so far.
+        """
+        print('Making Gram matrix of term-by-doc matrix...')
+        if self.checkpoints.has('gram'):
+            arrays, info = self.checkpoints.load('gram')
+            res = arrays['gram_mat']
+            shards_done, worker_stats = info['shards_done'], info['worker_stats']
+        else:
+            res = np.zeros((len(vocab), len(vocab)))
+            shards_done, worker_stats = [], []
+        self.report.update(num_shards_resumed=len(shards_done))
+
+        num_shards = len(self.w2dfs_paths)
+        todo = [i for i in range(num_shards) if i not in shards_done]
+        if todo:
+            w2dfs_paths = self._get_local_w2dfs_paths()
+            partials = Parallel(n_jobs=self.plan.num_jobs, return_as='generator')(
+                delayed(_make_gram_mat_chunk)(w2dfs_paths[i], vocab)
+                for i in todo
+            )
+            time_saved = timer()
+            # sum partial results as they arrive, so that they are not all held in memory
+            for i, (partial, stats) in zip(todo, partials):
+                partial = partial.tocoo()
+                res[partial.row, partial.col] += partial.data  # coo of csr does not contain duplicates
+                shards_done.append(i)
+                worker_stats.append(stats)
+                is_last = len(shards_done) == num_shards
+                if config.Checkpoints.is_enabled and (is_last or timer() - time_saved > config.Checkpoints.gram_interval):
+                    self.checkpoints.save('gram', {'gram_mat': res}, shards_done=shards_done, worker_stats=worker_stats)
+                    time_saved = timer()
+        print(f'Successfully built Gram matrix with shape={res.shape} requiring {res.nbytes / 1e6} megabytes')
+        counters = summarize_workers(worker_stats)
+        self.report.update(density=counters['num_nonzeros'] / (len(vocab) * counters['num_docs']), **counters)
+        return res
+
+    def _make_dense_term_by_doc_mat(self, vocab, chunk_sizes):
+
+        # init matrix directly on disk for mem-mapping - it is never allocated in memory.
+        # the matrix is part of the checkpoints, and each worker records that it populated its chunk
         print('Making term-by-doc matrix...')
-        init_mat = self.init_term_doc_mat()
-        dump(init_mat, self.mmap_path)  # dump large array to file for mem-mapping
-        del init_mat  # in-memory object can be deleted
+        mmap_path = self.checkpoints.to_array_path('dense', 'term_doc_mat')
 
         # If data are opened using the w+ or r+ mode in the main program,
         # the worker will get r+ mode access.
         # Thus the worker will be able to write its results directly to the original data,
         # alleviating the need of the serialization to send back the results to the parent process.
-        res = load(self.mmap_path, 'r+')
+        if self.checkpoints.has('dense'):
+            res = np.load(mmap_path, mmap_mode='r+')
+        else:
+            res = self.init_term_doc_mat(mmap_path)
+            self.checkpoints.save('dense')
 
         memmap_chunks = np.hsplit(res, np.cumsum(chunk_sizes[:-1]))
 
@@ -123,28 +391,61 @@ class SimMatBuilder:
         for c in memmap_chunks:
             print(c.shape)
 
-        assert len(memmap_chunks) == len(self.w2dfs_paths)
-        Parallel(n_jobs=config.Sims.num_jobs, max_nbytes=None)(
-            delayed(_make_term_by_window_mat_chunk)(memmap_chunk, w2dfs_path, vocab)
-            for memmap_chunk, w2dfs_path in zip(memmap_chunks, self.w2dfs_paths)
-        )
+        checkpoint_names = [f'dense_{i}' for i in range(len(chunk_sizes))]
+        todo = [i for i, name in enumerate(checkpoint_names) if not self.checkpoints.has(name)]
+        if todo:
+            w2dfs_paths = self._get_local_w2dfs_paths()
+            assert len(memmap_chunks) == len(w2dfs_paths)
+            Parallel(n_jobs=self.plan.num_jobs, max_nbytes=None)(
+                delayed(_make_term_by_window_mat_chunk)(memmap_chunks[i], w2dfs_paths[i], vocab,
+                                                        self.checkpoints, checkpoint_names[i])
+                for i in todo
+            )
+        worker_stats = [self.checkpoints.load(name)[1]['stats'] for name in checkpoint_names]
+        counters = summarize_workers(worker_stats)
+        counters['num_shards_resumed'] = len(chunk_sizes) - len(todo)
+        self.report.update(density=counters['num_nonzeros'] / res.size, **counters)
 
         return res
 
     @staticmethod
-    def _make_sim_mat(term_doc_mat):
+    def _make_embeddings(term_doc_mat):
         # convert to sparse format
-        num_nonzeros = np.count_nonzero(term_doc_mat)
-        print(f'Percentage of non-zeros in term-by-doc matrix: {num_nonzeros / term_doc_mat.size * 100}%')
+        if issparse(term_doc_mat):
+            num_nonzeros = term_doc_mat.nnz
+            sparse_mat = term_doc_mat
+        else:
+            num_nonzeros = np.count_nonzero(term_doc_mat)
+            sparse_mat = csr_matrix(term_doc_mat)
+        num_values = term_doc_mat.shape[0] * term_doc_mat.shape[1]
+        print(f'Percentage of non-zeros in term-by-doc matrix: {num_nonzeros / num_values * 100}%')
 
-        # reduce dimensionality
+        # reduce dimensionality - exact solver, so that embeddings are the same as in gram mode (up to sign)
         print('Performing truncated SVD...')
-        reducer = TruncatedSVD(n_components=config.Sims.num_svd_dimensions)
-        sparse_mat = csr_matrix(term_doc_mat)
+        num_dims = min(config.Sims.num_svd_dimensions, min(sparse_mat.shape) - 1)  # arpack requires fewer dimensions
+        reducer = TruncatedSVD(n_components=num_dims, algorithm='arpack')
         reduced_mat = reducer.fit_transform(sparse_mat)
 
-        # cosine
-        res = cosine_similarity(reduced_mat)
+        # L2-normalize so that cosine similarity is a dot product
+        res = normalize(reduced_mat)
+
+        return res
+
+    @staticmethod
+    def _make_embeddings_from_gram_mat(gram_mat):
+        """
+        if X = U S V.T, then X @ X.T = U S^2 U.T.
+        the top eigenvectors scaled by the square root of their eigenvalues are equal to U S,
+        the output of truncated SVD (up to sign).
+        """
+        print('Performing eigen-decomposition of Gram matrix...')
+        num_words = len(gram_mat)
+        num_dims = min(config.Sims.num_svd_dimensions, num_words)
+        eigenvalues, eigenvectors = eigh(gram_mat, subset_by_index=[num_words - num_dims, num_words - 1])
+        reduced_mat = eigenvectors[:, ::-1] * np.sqrt(eigenvalues[::-1].clip(min=0))
+
+        # L2-normalize so that cosine similarity is a dot product
+        res = normalize(reduced_mat)
 
         return res
 
@@ -153,7 +454,10 @@ class SimMatBuilder:
         res = []
         for param_name in self.corpus.param_names:
             param_path = to_param_path(param_name)
-            w2df_path = param_path / to_w2dfs_file_name(self.specs.corpus_size, self.specs.cat)
+            # prefer memory-mappable shard over pickle file
+            w2df_path = param_path / to_w2dfs_shard_name(self.specs.corpus_size, self.specs.cat)
+            if not w2df_path.exists():
+                w2df_path = param_path / to_w2dfs_file_name(self.specs.corpus_size, self.specs.cat)
             if not w2df_path.exists():
                 raise WikiNeighborsMissingW2Dfs(w2df_path)
             else:
@@ -161,49 +465,167 @@ class SimMatBuilder:
                 res.append(w2df_path)
         return res
 
-    def init_term_doc_mat(self):
-        # check that memory is sufficient
+    def init_term_doc_mat(self, mmap_path):
+        # zero-filled file - the planner has checked that disk space is sufficient
         shape = (self.specs.vocab_size, self.specs.corpus_size)
-        try:
-            init_mat = np.zeros(shape, dtype=np.int16)
-            num_mbs = init_mat.nbytes / 1e6
-            print(f'Successfully initialized matrix with shape={shape} requiring {num_mbs} megabytes')
-        except MemoryError:
-            raise WikiNeighborsNoMemory(shape)
-        else:
-            return init_mat
+        res = np.lib.format.open_memmap(mmap_path, mode='w+', dtype=np.int16, shape=shape)
+        print(f'Successfully initialized mem-mapped matrix with shape={shape} requiring {res.nbytes / 1e6} megabytes')
+        return res
 
-    def _save_to_disk(self, vocab, sim_mat):
+    @staticmethod
+    def _make_ann_index(embeddings):
+        num_lists = int(np.sqrt(len(embeddings)))
+        index = IVFIndex.build(embeddings, num_lists)
+        report = evaluate_index(index, embeddings,
+                                k=config.Max.num_neighbors,
+                                num_probes_list=config.Ann.eval_num_probes,
+                                num_queries=config.Ann.num_eval_queries)
+        info = {'num_lists': len(index.centroids),
+                'num_probes': config.Ann.num_probes,
+                'report': report}
+        return index.to_arrays(), info
+
+    def _make_neighbor_table(self, embeddings):
+        """
+        return ids and similarities of the k nearest neighbors of each word, sorted from most to least similar.
+        each worker processes a block of rows, and compares it to one tile of columns at a time,
+        so that memory per worker is bounded by block_size * tile_size similarities.
+        """
+        k = min(config.Max.num_neighbors, len(embeddings) - 1)
+        block_size = config.NeighborTable.block_size
+        print(f'Making table of {k} nearest neighbors for {len(embeddings)} words...')
+        res_ids = np.zeros((len(embeddings), k), dtype=np.int32)
+        res_sims = np.zeros((len(embeddings), k), dtype=np.float32)
+        starts = range(0, len(embeddings), block_size)
+        blocks = Parallel(n_jobs=self.plan.num_jobs, return_as='generator')(
+            delayed(_make_neighbor_table_chunk)(embeddings, start, start + block_size, k)
+            for start in starts
+        )
+        for start, (block_ids, block_sims) in zip(starts, blocks):
+            res_ids[start: start + len(block_ids)] = block_ids
+            res_sims[start: start + len(block_sims)] = block_sims
+        self.report.update(num_neighbors=k, num_blocks=len(starts))
+        return res_ids, res_sims
+
+    @staticmethod
+    def _quantize_embeddings(embeddings):
+        """
+        compact embeddings are only returned if neighbors found with them match float64 neighbors
+        """
+        quantized = QuantizedEmbeddings.build(embeddings, config.Quantization.dtype)
+        report = evaluate_quantization(quantized, embeddings,
+                                       k=config.Max.num_neighbors,
+                                       num_candidates=config.Quantization.num_candidates,
+                                       num_queries=config.Quantization.num_eval_queries)
+        print(f'Quantized embeddings to {config.Quantization.dtype}: recall={report["recall"]:.4f} '
+              f'max error of approximate similarity={report["max_approximate_sim_error"]:.4f}')
+        info = dict(report,
+                    dtype=config.Quantization.dtype,
+                    num_candidates=config.Quantization.num_candidates,
+                    min_recall=config.Quantization.min_recall,
+                    is_saved=report['recall'] >= config.Quantization.min_recall)
+        if not info['is_saved']:
+            print(f'Recall is below {config.Quantization.min_recall}. Not saving quantized embeddings')
+            return {}, info
+        return quantized.to_arrays(), info
+
+    def _save_to_disk(self, arrays, build_info, specs):
         # make dir + save to disk
         if not self.cache_path.is_dir():
             self.cache_path.mkdir(parents=True)
 
-        with (self.cache_path / self.vocab_file_name).open('wb') as f:
-            pickle.dump(vocab, f)
-        print(f'Saved vocab to {config.LocalDirs.cache}')
+        build_info = dict(build_info,
+                          num_svd_dimensions=config.Sims.num_svd_dimensions,
+                          term_doc_mode=self.plan.mode,
+                          w2dfs_paths=[str(p) for p in self.w2dfs_paths])
+        model_path = self.cache_path / make_model_dir_name(specs)
+        save_model(model_path, arrays, specs, build_info)
+        print(f'Saved vocab and embeddings to {model_path}')
 
-        with (self.cache_path / self.sim_mat_file_name).open('wb') as f:
-            pickle.dump(sim_mat, f)
-        print(f'Saved sim_mat to {config.LocalDirs.cache}')
+
+def _remove_stale_temp_dirs():
+    """
+    remove temporary directories left behind by builds whose process is no longer running
+    """
+    for p in Path(tempfile.gettempdir()).glob('wikineighbors_*_*'):
+        pid = p.name.split('_')[1]
+        if pid.isdigit() and not is_process_alive(int(pid)):
+            print(f'Removing {p}')
+            shutil.rmtree(str(p))
 
 
-def _make_term_by_window_mat_chunk(memmap_chunk, w2dfs_path, vocab):
+def _make_term_by_window_mat_chunk(memmap_chunk, w2dfs_path, vocab, checkpoints, checkpoint_name):
     print('Starting worker', flush=True)
 
-    w2id = {w: n for n, w in enumerate(vocab)}
+    shard = Shard.load(w2dfs_path)
+    print(f'Worker loaded {w2dfs_path}')
+
+    with measure_worker(shard.num_docs) as stats:
+        # writing to disk is very slow, so only write nonzero values
+        row_ids = shard.map_words(vocab)[shard.word_ids]
+        is_in_vocab = row_ids != -1
+        memmap_chunk[row_ids[is_in_vocab], shard.doc_ids[is_in_vocab]] = shard.counts[is_in_vocab]
+        stats['num_nonzeros'] = int(is_in_vocab.sum())
+
+    print(f'Worker populated memmap chunk with shape {memmap_chunk.shape} '
+          f'at {stats["docs_per_sec"]:.0f} docs/sec', flush=True)
+    # writes to the shared mapping reach the file even if the process is killed afterwards
+    checkpoints.save(checkpoint_name, stats=stats)  # chunk is not populated again when build is resumed
 
-    with w2dfs_path.open('rb') as f:
-        w2dfs = pickle.load(f)
+
+def _make_term_by_doc_triplets_chunk(w2dfs_path, vocab):
+    print('Starting worker', flush=True)
+
+    shard = Shard.load(w2dfs_path)
     print(f'Worker loaded {w2dfs_path}')
 
-    start = timer()
-    for col_id, w2df in enumerate(w2dfs):
-        if col_id % 10000 == 0:
-            print(col_id, timer() - start)
+    with measure_worker(shard.num_docs) as stats:
+        # only entries of words in vocab are kept
+        row_ids = shard.map_words(vocab)[shard.word_ids]
+        is_in_vocab = row_ids != -1
+        triplet = (row_ids[is_in_vocab],
+                   shard.doc_ids[is_in_vocab],
+                   shard.counts[is_in_vocab].astype(np.int16))
+        stats['num_nonzeros'] = len(triplet[0])
+
+    print(f'Worker collected {stats["num_nonzeros"]} non-zero values from {shard.num_docs} docs '
+          f'at {stats["docs_per_sec"]:.0f} docs/sec', flush=True)
+    return triplet, stats
 
-        # writing to disk is very slow, so only write nonzero values
-        words_in_doc = [w for w in vocab if w in w2df]
-        row_ids = [w2id[w] for w in words_in_doc]
-        memmap_chunk[row_ids, col_id] = [w2df[w] for w in words_in_doc]
 
-    print(f'Worker populated memmap chunk with shape {memmap_chunk.shape}', flush=True)
\ No newline at end of file
+def _save_term_by_doc_triplets_chunk(w2dfs_path, vocab, checkpoints, checkpoint_name):
+    (row_ids, col_ids, counts), stats = _make_term_by_doc_triplets_chunk(w2dfs_path, vocab)
+    checkpoints.save(checkpoint_name, {'rows': row_ids, 'cols': col_ids, 'counts': counts}, stats=stats)
+
+
+def _make_gram_mat_chunk(w2dfs_path, vocab):
+    (row_ids, col_ids, counts), stats = _make_term_by_doc_triplets_chunk(w2dfs_path, vocab)
+    start = timer()
+    shape = (len(vocab), int(col_ids.max(initial=0)) + 1)
+    term_by_doc_mat = csr_matrix((counts.astype(np.float64), (row_ids, col_ids)), shape=shape)
+    res = term_by_doc_mat @ term_by_doc_mat.T
+    stats['matmul_time'] = timer() - start
+    print(f'Worker computed Gram matrix with {res.nnz} non-zero values', flush=True)
+    return res, stats
+
+
+def _make_neighbor_table_chunk(embeddings, start, stop, k):
+    queries = embeddings[start: stop]
+    query_ids = np.arange(start, start + len(queries))
+    rows = np.arange(len(queries))
+    res_ids = np.zeros((len(queries), 0), dtype=np.int64)
+    res_sims = np.zeros((len(queries), 0))
+    for tile_start in range(0, len(embeddings), config.NeighborTable.tile_size):
+        tile = embeddings[tile_start: tile_start + config.NeighborTable.tile_size]
+        sims = queries @ tile.T
+        is_in_tile = (query_ids >= tile_start) & (query_ids < tile_start + len(tile))
+        sims[rows[is_in_tile], query_ids[is_in_tile] - tile_start] = -np.inf  # exclude word itself
+
+        # merge top k of tile with top k of previous tiles
+        tile_top = _top_k_2d(sims, min(k, len(tile)))
+        candidate_ids = np.hstack([res_ids, tile_top + tile_start])
+        candidate_sims = np.hstack([res_sims, np.take_along_axis(sims, tile_top, axis=1)])
+        top = _top_k_2d(candidate_sims, min(k, candidate_ids.shape[1]))
+        res_ids = np.take_along_axis(candidate_ids, top, axis=1)
+        res_sims = np.take_along_axis(candidate_sims, top, axis=1)
+    return res_ids.astype(np.int32), res_sims.astype(np.float32)
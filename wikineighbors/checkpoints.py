@@ -0,0 +1,76 @@
+import attr
+import hashlib
+import shutil
+import json
+import os
+import numpy as np
+
+from wikineighbors.utils import stat_files, save_json
+from wikineighbors import config
+
+
+class Checkpoints:
+    """
+    outputs of build stages (and of workers within a stage), saved so that a failed build resumes where it stopped.
+
+    checkpoints are kept in a directory named after a fingerprint of everything their contents depend on,
+    so that checkpoints made from different inputs are never mixed, and are removed once inputs change.
+    a checkpoint is complete once its info file exists, which is written after its arrays.
+    """
+
+    def __init__(self, path, fingerprint):
+        self.root = path
+        self.path = path / fingerprint
+
+    def prepare(self):
+        if self.root.exists():
+            for p in self.root.iterdir():
+                if p != self.path:  # made from different inputs - can never be resumed
+                    print(f'Removing stale checkpoints {p}')
+                    shutil.rmtree(str(p))
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def has(self, name):
+        return self._to_info_path(name).exists()
+
+    def save(self, name, arrays=None, **info):
+        arrays = arrays or {}
+        for array_name, arr in arrays.items():
+            path = self.to_array_path(name, array_name)
+            tmp_path = path.parent / f'{path.name}.{os.getpid()}.tmp'
+            with tmp_path.open('wb') as f:
+                np.save(f, arr)
+            tmp_path.replace(path)
+        # atomic, so a checkpoint is never seen before it is complete
+        save_json(self._to_info_path(name), dict(info, arrays=list(arrays)))
+
+    def load(self, name, mmap_mode=None):
+        with self._to_info_path(name).open('r') as f:
+            info = json.load(f)
+        arrays = {array_name: np.load(self.to_array_path(name, array_name), mmap_mode=mmap_mode)
+                  for array_name in info.pop('arrays')}
+        return arrays, info
+
+    def to_array_path(self, name, array_name):
+        return self.path / f'{name}.{array_name}.npy'
+
+    def _to_info_path(self, name):
+        return self.path / f'{name}.json'
+
+    def remove(self):
+        if self.root.exists():
+            shutil.rmtree(str(self.root))
+
+
+def make_fingerprint(specs, w2dfs_paths):
+    """
+    hash of specs, size and time modified of each input shard, and configuration that outputs of stages depend on
+    """
+    must_include = (config.LocalDirs.root / config.Sims.must_include_f_name).read_text()
+    key = {'version': config.Checkpoints.version,
+           'specs': attr.asdict(specs),
+           'shards': [[str(p), stat_files(p)] for p in w2dfs_paths],
+           'must_include': must_include,
+           'max_word_size': config.Sims.max_word_size,
+           'num_svd_dimensions': config.Sims.num_svd_dimensions}
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
@@ -8,7 +8,9 @@ dirs = AppDirs(wikineighbors.__name__, wikineighbors.__author__, wikineighbors._
 
 
 class RemoteDirs:
-    if wikineighbors.s76:
+    if os.environ.get('WIKINEIGHBORS_LUDWIG_DATA'):  # e.g. a synthetic corpus made by benchmark.py
+        ludwig_data = Path(os.environ['WIKINEIGHBORS_LUDWIG_DATA'])
+    elif wikineighbors.s76:
         ludwig_data = Path('/') / 'mnt' / 'md0' / 'ludwig_data'
     else:
         ludwig_data = Path(wikineighbors.mnt_point) / 'ludwig_data'
@@ -22,7 +24,7 @@ class LocalDirs:
     root = Path(__file__).parent.parent
     src = root / 'wikineighbors'
     static = root / 'static'
-    cache = Path(dirs.user_cache_dir)
+    cache = Path(os.environ.get('WIKINEIGHBORS_CACHE', dirs.user_cache_dir))
 
 
 class Default:
@@ -31,6 +33,18 @@ class Default:
     word = ''
 
 
+class Home:
+    refresh_interval = 10 * 60  # seconds after which corpus metadata is refreshed in the background
+    index_file_name = 'home_index.json'
+
+
+class Discovery:
+    num_threads = 16  # for probing the file server in parallel
+    validation_interval = 30  # seconds during which discovery results are used without checking for changes
+    persist = True  # save discovery results to local cache, so that they survive restarts of the app
+    file_name = 'corpus_index.json'
+
+
 class Time:
     format = '%B %d %Y'
 
@@ -38,11 +52,92 @@ class Time:
 class Max:
     num_fields = 50
     num_neighbors = 10
+    batch_num_bytes = 256 * 1000 * 1000  # memory of similarities computed per matrix multiply
+    num_completions = 20  # number of words suggested while typing
+    num_pairs_per_batch = 10000  # number of word pairs whose similarities are computed at once in bulk requests
 
 
 class Sims:
     num_jobs = 6
+    # 'sparse' collects non-zero counts only, 'dense' mem-maps a full int16 matrix,
+    # 'gram' streams shards and accumulates a vocab-by-vocab matrix (memory independent of number of documents).
+    # 'auto' lets the planner choose based on available memory
+    term_doc_mode = 'auto'
+    density = 0.005  # approximate fraction of non-zero values in term-by-doc matrix
     max_word_size = 8
     vocab_sizes = [1000, 2000, 3000, 4000, 5000, 10000]
     num_svd_dimensions = 30  # keep this low to prevent memory error
     must_include_f_name = 'agents.txt'
+
+
+class Planner:
+    modes = ['sparse', 'gram', 'dense']  # in order of preference
+    memory_fraction = 0.8  # of available memory that a build may use
+    strict = True  # refuse to start builds which are not expected to fit into memory
+    pickle_bytes_per_entry = 10  # approximate size of a word-frequency pair in a pickle file
+    unpickled_bytes_per_entry = 100  # approximate size of a word-frequency pair in a Python dict
+
+
+class Checkpoints:
+    is_enabled = True  # save outputs of build stages in local cache, so that a failed build resumes where it stopped
+    version = 2  # increment when the contents of checkpoints change
+    dir_suffix = '.checkpoints'  # appended to name of model
+    gram_interval = 300  # seconds between checkpoints of the Gram matrix while it is accumulated
+
+
+class Staging:
+    is_enabled = True  # copy shards to local disk before building
+    dir_name = 'shards'  # in local cache
+    max_num_bytes = 200 * 10 ** 9  # least-recently used copies are removed when their total size exceeds this
+    num_threads = 4  # number of shards copied at the same time
+    verify_checksum = True  # compare checksum of local copy with checksum computed while copying, before re-use
+    chunk_size = 8 * 2 ** 20  # bytes
+
+
+class Cache:
+    max_num_model_bytes = 4 * 10 ** 9  # loaded models are evicted when their total size exceeds this
+    max_num_results = 100000  # neighbor lists and similarity tables are evicted when their number exceeds this
+
+
+class Jobs:
+    max_num_bytes = 24 * 10 ** 9  # builds are queued while estimated memory of running builds exceeds this
+    poll_interval = 5  # seconds between progress updates on build page
+    dir_name = 'jobs'  # in local cache - records of submitted jobs, shared by all worker processes of a server
+
+
+class Serving:
+    num_workers = 4  # worker processes forked by serve.py - models are loaded once and shared by all workers
+    port = 5000
+    timeout = 120  # seconds before an unresponsive worker is restarted
+    preload_models = []  # loaded before workers are forked, e.g. 'Corpus-1/4000_4800000_NOUN'
+
+
+class Ann:
+    min_vocab_size = 50000  # an approximate nearest-neighbor index is built for vocabularies at least this large
+    num_iterations = 10  # of k-means
+    num_probes = 16  # number of lists searched per query - increase for higher recall
+    eval_num_probes = [1, 2, 4, 8, 16, 32, 64]
+    num_eval_queries = 1000
+
+
+class NeighborTable:
+    is_built = False  # save nearest neighbors of every word with the model
+    block_size = 1024  # number of rows (words) processed per task
+    tile_size = 8192  # number of columns compared at once - memory per worker is block_size * tile_size floats
+
+
+class Quantization:
+    dtype = None  # 'int8' or 'float16' to keep only compact embeddings in memory, or None to use float64 only
+    num_candidates = 100  # number of approximate neighbors that are re-ranked exactly
+    min_recall = 0.99  # compact embeddings are only saved if re-ranked neighbors match float64 neighbors this often
+    num_eval_queries = 1000
+
+
+class Metrics:
+    timed_endpoints = ['views.neighbors', 'views.validate']  # request latency is recorded for these views
+    latency_buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]  # seconds
+
+
+class Artifacts:
+    version = 2  # increment when the layout of saved models changes
+    manifest_file_name = 'manifest.json'
@@ -1,9 +1,11 @@
 from cached_property import cached_property
+from pathlib import Path
 import yaml
 
 from wikineighbors.exceptions import WikiNeighborsNoArticlesFound
 from wikineighbors.utils import gen_100_param_names, to_param_path
-from wikineighbors.file_names import to_w2dfs_file_name
+from wikineighbors.file_names import to_w2dfs_file_name, to_w2dfs_shard_name
+from wikineighbors.discovery import discovery_cache
 from wikineighbors import config
 
 
@@ -25,8 +27,8 @@ class Corpus:
             return []
 
         names = []
-        for p in self.cache_path.glob('vocab_*_*.pkl'):
-            names.append(p.stem.lstrip('vocab_').replace('_', self.separator))
+        for p in self.cache_path.glob('*/' + config.Artifacts.manifest_file_name):
+            names.append(p.parent.name.replace('_', self.separator))
         return sorted(names)
 
     @cached_property
@@ -35,18 +37,22 @@ class Corpus:
 
     @cached_property
     def param_names(self):
+        return discovery_cache.get(self.name, 'param_names', self._find_param_names)
+
+    def _find_param_names(self):
+        # probe all possible param_names in parallel
+        possible_param_names = list(gen_100_param_names(self.name))
+        param2vals = discovery_cache.map(_load_param2val, possible_param_names)
+
         param_names = []
         parts = set()  # a param_name is only valid if its attribute "parts" was not previously collected
-        for param_name in gen_100_param_names(self.name):
-            param_path = to_param_path(param_name)
+        for param_name, param2val in zip(possible_param_names, param2vals):
 
             # make sure path exists
-            if not param_path.exists():
-                break  # this break is required, else infinite loop
+            if param2val is None:
+                break  # this break is required, else param_names of other corpora are collected
 
             # make sure that param_name is valid (that it really is part of the corpus)
-            with (param_path / 'param2val.yaml').open('r') as f:
-                param2val = yaml.load(f, Loader=yaml.FullLoader)
             if param2val['part'] in parts:
                 continue  # this happens because param_names are generated by returning all possible param_names
 
@@ -57,22 +63,48 @@ class Corpus:
 
     @cached_property
     def txt_paths(self):
+        body_paths_list = discovery_cache.get(self.name, 'body_paths', self._find_body_paths)
         res = []
-        for param_name in self.param_names:
+        for param_name, body_paths in zip(self.param_names, body_paths_list):
             param_path = to_param_path(param_name)
             # check that articles are available (bodies.txt files)
-            body_paths = [p for p in param_path.glob('**/bodies.txt')]
             num_bodies = len(body_paths)
             if num_bodies == 0:
                 raise WikiNeighborsNoArticlesFound(param_path)
             elif num_bodies > 1:
                 raise SystemError('Found more than 1 bodies.txt files in {}'.format(param_name))
             else:
-                res.append(body_paths[0])
+                res.append(Path(body_paths[0]))
         return res
 
+    def _find_body_paths(self):
+        return discovery_cache.map(_find_body_paths, self.param_names)
+
     @cached_property
     def w2dfs_names(self):
+        """
+        names of shards (converted or pickled) without file extension
+        """
+        return discovery_cache.get(self.name, 'w2dfs_names', self._find_w2dfs_names)
+
+    def _find_w2dfs_names(self):
         first_param_path = to_param_path(self.param_names[0])
-        pattern = to_w2dfs_file_name('*', '*')
-        return [p.name for p in first_param_path.glob(pattern)]
\ No newline at end of file
+        shard_names = {p.name for p in first_param_path.glob(to_w2dfs_shard_name('*', '*'))
+                       if p.is_dir() and p.suffix != '.tmp'}
+        pickle_names = {p.stem for p in first_param_path.glob(to_w2dfs_file_name('*', '*'))}
+        return sorted(shard_names | pickle_names)
+
+
+def _load_param2val(param_name):
+    """
+    return None if param_name does not exist
+    """
+    try:
+        with (to_param_path(param_name) / 'param2val.yaml').open('r') as f:
+            return yaml.load(f, Loader=yaml.FullLoader)
+    except FileNotFoundError:
+        return None
+
+
+def _find_body_paths(param_name):
+    return [str(p) for p in to_param_path(param_name).glob('**/bodies.txt')]
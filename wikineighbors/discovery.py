@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import json
+import time
+import os
+
+from wikineighbors.utils import to_param_path, save_json
+from wikineighbors import config
+
+
+class DiscoveryCache:
+    """
+    process-wide cache of what was found on the file server for each corpus (param_names, bodies.txt, w2dfs).
+    results are invalidated when the time modified of the runs folder or of any param_name folder of a corpus changes.
+    file system probes are fanned out over a thread pool, so that latency of the remote mount is paid only once.
+    a pool is created for each scan rather than kept, because processes are forked from the app (e.g. gunicorn workers),
+    and a forked child inherits the pool without its threads.
+    """
+
+    def __init__(self, path=None):
+        self.path = path  # if not None, results are saved, so that they survive restarts of the app
+        self.entries = self._load()  # corpus name -> entry
+        self.lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._reset_lock)  # lock may be held by a thread that is not forked
+
+    def _reset_lock(self):
+        self.lock = threading.Lock()
+
+    def _load(self):
+        if self.path is None or not self.path.exists():
+            return {}
+        with self.path.open('r') as f:
+            entries = json.load(f)
+        for entry in entries.values():
+            entry['time_validated'] = 0  # validate once after restart
+        return entries
+
+    def _save(self):
+        if self.path is None:
+            return
+        save_json(self.path, self.entries)
+
+    def get(self, corpus_name, key, find):
+        """
+        return cached result for key, or call find() if there is no valid cached result
+        """
+        with self.lock:
+            entry = self.entries.get(corpus_name)
+            if entry is not None and not self._is_valid(entry):
+                print(f'Invalidating discovery results for {corpus_name}')
+                entry = None
+            if entry is None:
+                entry = self.entries[corpus_name] = {'mtimes': {}, 'time_validated': time.time()}
+            if key in entry:
+                return entry[key]
+
+        # find outside lock because probing the file server can be slow
+        res = find()
+        with self.lock:
+            entry[key] = res
+            param_names = entry.get('param_names', [])
+            paths = [str(config.RemoteDirs.wiki_runs)] + [str(to_param_path(n)) for n in param_names]
+            entry['mtimes'] = dict(zip(paths, self.map(_get_mtime, paths)))
+            self._save()
+        return res
+
+    def _is_valid(self, entry):
+        if time.time() - entry['time_validated'] < config.Discovery.validation_interval:
+            return True
+        paths = list(entry['mtimes'])
+        is_valid = self.map(_get_mtime, paths) == [entry['mtimes'][p] for p in paths]
+        if is_valid:
+            entry['time_validated'] = time.time()
+        return is_valid
+
+    def map(self, fn, iterable):
+        """
+        apply fn (e.g. a file system probe) to each item in parallel
+        """
+        with ThreadPoolExecutor(config.Discovery.num_threads) as executor:
+            return list(executor.map(fn, iterable))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self._save()
+
+
+def _get_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+discovery_cache = DiscoveryCache(config.LocalDirs.cache / config.Discovery.file_name
+                                 if config.Discovery.persist else None)
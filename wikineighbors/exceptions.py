@@ -15,9 +15,11 @@ class WikiNeighborsNoVocabFound(Exception):
 
 
 class WikiNeighborsNoMemory(Exception):
-    def __init__(self, shape, status_code=500):
+    def __init__(self, num_bytes, available_bytes, status_code=500):
         Exception.__init__(self)
-        self.message = 'WikiNeighbors: Not enough memory for matrix of shape {}'.format(shape)
+        self.message = ('WikiNeighbors: Build requires an estimated {} megabytes, '
+                        'but only {} megabytes are available').format(
+            num_bytes // 10 ** 6, available_bytes // 10 ** 6)
         if status_code is not None:
             self.status_code = status_code
 
@@ -35,4 +37,13 @@ class WikiNeighborsNoSpecs(Exception):
         Exception.__init__(self)
         self.message = 'WikiNeighbors: Must load vocabulary for {}'.format(corpus_name)
         if status_code is not None:
-            self.status_code = status_code
\ No newline at end of file
+            self.status_code = status_code
+
+
+class WikiNeighborsIncompatibleModel(Exception):
+    def __init__(self, model_path, version, status_code=500):
+        Exception.__init__(self)
+        self.message = 'WikiNeighbors: Model in {} has format version {}. Please re-build it'.format(
+            model_path, version)
+        if status_code is not None:
+            self.status_code = status_code
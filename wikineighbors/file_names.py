@@ -1,16 +1,25 @@
+import re
 
+regex_w2dfs = re.compile(r'^w2dfs_(.+)_(.+?)(\.pkl)?$')
 
-def make_cached_file_name(object_name, specs):
-    return '{}_{}_{}_{}.pkl'.format(object_name,
-                                    specs.vocab_size,
-                                    specs.corpus_size,
-                                    specs.cat)
+
+def make_model_dir_name(specs):
+    return '{}_{}_{}'.format(specs.vocab_size,
+                             specs.corpus_size,
+                             specs.cat)
 
 
 def get_corpus_size_and_cat(file_name):
-    tmp = file_name.lstrip('w2dfs_').rstrip('.pkl').rpartition('_')
-    return tmp[0], tmp[2]
+    """
+    works for pickle file names (w2dfs_4800_NOUN.pkl) and shard names (w2dfs_4800_NOUN)
+    """
+    match = regex_w2dfs.match(file_name)
+    return match.group(1), match.group(2)
 
 
 def to_w2dfs_file_name(corpus_size, cat):
-    return 'w2dfs_{}_{}.pkl'.format(corpus_size, cat)
\ No newline at end of file
+    return 'w2dfs_{}_{}.pkl'.format(corpus_size, cat)
+
+
+def to_w2dfs_shard_name(corpus_size, cat):
+    return 'w2dfs_{}_{}'.format(corpus_size, cat)
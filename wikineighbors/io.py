@@ -1,9 +1,94 @@
 from wikineighbors import config
 import yaml
-from wikineighbors.utils import get_id_as_int, get_time_modified, count_replications
+import os
+import json
+import time
+import hashlib
+import datetime
+import threading
+from wikineighbors.utils import get_id_as_int, count_replications, save_json
 
 
-def make_home_data():
+class HomeIndex:
+    """
+    local index of corpus metadata, so that the remote file server is not scanned on every request.
+    an entry is re-read from the file server only when the time modified of its param_name folder changes.
+    the index is saved to the local cache, so that it survives restarts of the app.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = self._load()  # param_name -> entry
+        self.time_refreshed = None
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def _load(self):
+        if not self.path.exists():
+            return {}
+        with self.path.open('r') as f:
+            return json.load(f)
+
+    def _save(self):
+        save_json(self.path, self.entries)
+
+    def refresh(self):
+        with self.lock:
+            entries = {}
+            num_updated = 0
+            with os.scandir(config.RemoteDirs.wiki_runs) as it:
+                for dir_entry in it:
+                    if not dir_entry.name.startswith('param') or not dir_entry.is_dir():
+                        continue
+                    mtime = dir_entry.stat().st_mtime
+                    entry = self.entries.get(dir_entry.name)
+                    if entry is None or entry['mtime'] != mtime:
+                        entry = self._make_entry(dir_entry.path, dir_entry.name, mtime)
+                        num_updated += 1
+                    entries[dir_entry.name] = entry
+            self.entries = entries
+            self.time_refreshed = time.time()
+            self._save()
+        print(f'Refreshed home index. Updated {num_updated} of {len(entries)} entries')
+
+    @staticmethod
+    def _make_entry(path, param_name, mtime):
+        with open(os.path.join(path, 'param2val.yaml'), 'r') as f:
+            param2val = yaml.load(f, Loader=yaml.FullLoader)
+        reduced_param2val = param2val
+        del reduced_param2val['job_name']
+        del reduced_param2val['param_name']
+        del reduced_param2val['part']
+        # hash of reduced param2val identifies a corpus, regardless of which part of the corpus is in folder
+        serialized = json.dumps(reduced_param2val, sort_keys=True, default=str)
+        return {'mtime': mtime,
+                'reduced_param2val': {k: str(v) for k, v in reduced_param2val.items()},
+                'hash': hashlib.sha1(serialized.encode()).hexdigest(),
+                'num_replications': count_replications(param_name)}
+
+    def refresh_in_background(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self.refresh, daemon=True)
+        self.thread.start()
+
+    def get_entries(self, refresh=False):
+        """
+        return entries immediately.
+        entries are refreshed synchronously only if requested or if none exist,
+        otherwise stale entries are refreshed in the background.
+        """
+        if refresh or not self.entries:
+            self.refresh()
+        elif self.time_refreshed is None or time.time() - self.time_refreshed > config.Home.refresh_interval:
+            self.refresh_in_background()
+        return self.entries
+
+
+home_index = HomeIndex(config.LocalDirs.cache / config.Home.index_file_name)
+
+
+def make_home_data(refresh=False):
     """
     make a row for each corpus - an abstraction over possibly many parameter configurations
     because a corpus is typically created in parallel on multiple machines, producing multiple bodies.txt files.
@@ -11,43 +96,35 @@ def make_home_data():
     (comparison is performed AFTER 'part' is removed from param2val).
     to achieve this, param_name folders must be iterated over in order (param_1, param2, ...)
     """
-    reduced_param2vals = []
+    hashes = set()
     buttons = ['info', 'build', 'query']  # careful, these must also be names of URLS
     headers = ['Corpus ID', 'Last modified']
     rows = []
-    all_param_paths = config.RemoteDirs.wiki_runs.glob('param*')
-    for p in sorted(all_param_paths, key=lambda p: get_id_as_int(p.name)):
-
-        # make param2val_reduced
-        with (p / 'param2val.yaml').open('r') as f:
-            param2val = yaml.load(f, Loader=yaml.FullLoader)
-        reduced_param2val = param2val
-        del reduced_param2val['job_name']
-        del reduced_param2val['param_name']
-        del reduced_param2val['part']
+    entries = home_index.get_entries(refresh)
+    for param_name in sorted(entries, key=get_id_as_int):
+        entry = entries[param_name]
 
         # do not assign a row to a configuration which has already been assigned a row
         # this has a filtering effect because 'part' information is first removed
-        if reduced_param2val not in reduced_param2vals:  # lets through only a new corpus
-            param_id = get_id_as_int(p.name)
+        if entry['hash'] not in hashes:  # lets through only a new corpus
+            param_id = get_id_as_int(param_name)
             corpus_name = 'Corpus-{}'.format(param_id)
             tooltip = ''
-            for k, v in sorted(reduced_param2val.items()):
+            for k, v in sorted(entry['reduced_param2val'].items()):
                 tooltip += f'<p style="margin-bottom: 0px">{k}={v}</p>'
             row = {headers[0]: param_id,
-                   headers[1]: get_time_modified(p),
+                   headers[1]: datetime.datetime.fromtimestamp(entry['mtime']).strftime(config.Time.format),
                    # used, but not displayed in table
                    'corpus_name': corpus_name,
                    'tooltip': tooltip,
+                   'mtime': entry['mtime'],
                    #
                    'buttons': buttons
                    }
 
-            assert count_replications(p.name) == 1
+            assert entry['num_replications'] == 1
             rows.append(row)
 
-        reduced_param2vals.append(reduced_param2val)
+        hashes.add(entry['hash'])
 
     return headers, rows, buttons
-
-
@@ -0,0 +1,266 @@
+from collections import OrderedDict
+from multiprocessing.connection import wait
+import multiprocessing
+import attr
+import threading
+import json
+import time
+import uuid
+import os
+
+import wikineighbors
+from wikineighbors.corpus import Corpus
+from wikineighbors.builder import SimMatBuilder
+from wikineighbors.build_process import build_and_save
+from wikineighbors.file_names import make_model_dir_name
+from wikineighbors.planner import make_plan
+from wikineighbors.specs import Specs
+from wikineighbors.exceptions import WikiNeighborsNoMemory
+from wikineighbors.utils import is_process_alive, save_json
+from wikineighbors import config
+
+
+class BuildJob:
+    """
+    a build running (or waiting to run) in a separate process.
+    the build is planned when the job is created, so that builds which do not fit into memory are never started.
+    """
+
+    def __init__(self, corpus_name, specs, vocab_sizes=None):
+        self.job_id = uuid.uuid4().hex
+        self.corpus_name = corpus_name
+        self.specs = specs
+        self.vocab_sizes = vocab_sizes
+        self.plan = make_build_plan(corpus_name, specs, vocab_sizes)
+        if not self.plan.fits and config.Planner.strict:
+            raise WikiNeighborsNoMemory(self.plan.num_bytes, self.plan.budget_bytes)
+        self.num_bytes = self.plan.num_bytes
+        self.time_submitted = time.time()
+        self.process = None
+        self.status = 'queued'
+        self.progress_path = _to_progress_path(corpus_name, specs)
+
+    @property
+    def is_active(self):
+        return self.status in {'queued', 'running'}
+
+    @property
+    def model_key(self):
+        return self.corpus_name, self.specs
+
+    def start(self, context):
+        if self.progress_path.exists():
+            self.progress_path.unlink()  # progress of previous build
+        self.process = context.Process(target=build_and_save,
+                                       args=(wikineighbors.s76, self.corpus_name, self.specs, self.vocab_sizes,
+                                             attr.asdict(self.plan)))
+        self.process.start()
+        self.status = 'running'
+
+    def update(self):
+        if self.status == 'running' and self.process.exitcode is not None:
+            self.process.join()
+            self.status = 'done' if self.process.exitcode == 0 else 'failed'
+
+    def to_record(self):
+        """
+        everything about the job that other processes need to report its status
+        """
+        return {'job_id': self.job_id,
+                'pid': os.getpid(),  # of worker that owns the job
+                'build_pid': self.process.pid if self.process is not None else None,
+                'corpus_name': self.corpus_name,
+                'vocab_name': make_model_dir_name(self.specs),
+                'vocab_sizes': self.vocab_sizes,
+                'status': self.status,
+                'num_bytes': self.num_bytes,
+                'term_doc_mode': self.plan.mode,
+                'num_jobs': self.plan.num_jobs,
+                'time_submitted': self.time_submitted}
+
+    def to_dict(self):
+        return dict(self.to_record(), **_read_progress(self.progress_path, self.status))
+
+
+class JobRecord:
+    """
+    a build job submitted to another worker process of the same server, read from disk.
+    only the submitting process can observe the build process,
+    so the status of a running build is inferred from the progress file written by the build.
+    """
+
+    def __init__(self, record):
+        self.record = record
+        self.job_id = record['job_id']
+        self.corpus_name = record['corpus_name']
+        self.specs = Specs(*record['vocab_name'].split('_'))
+        self.vocab_sizes = record['vocab_sizes']
+        self.num_bytes = record['num_bytes']
+        self.time_submitted = record['time_submitted']
+        self.progress_path = _to_progress_path(self.corpus_name, self.specs)
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with path.open('r') as f:
+                return cls(json.load(f))
+        except (FileNotFoundError, ValueError):  # job does not exist, or file is being replaced
+            return None
+
+    @property
+    def status(self):
+        if self.record['status'] == 'queued':
+            # a worker that was restarted (e.g. by gunicorn after a timeout) never starts its queued jobs
+            return 'queued' if is_process_alive(self.record['pid']) else 'failed'
+        elif self.record['status'] != 'running':
+            return self.record['status']
+        progress = _read_progress(self.progress_path, 'running')
+        if progress['error'] is not None:
+            return 'failed'
+        elif progress['stage'] == 'done':
+            return 'done'
+        elif not is_process_alive(self.record['build_pid']):  # killed before it could report an error
+            return 'failed'
+        else:
+            return 'running'
+
+    @property
+    def is_active(self):
+        return self.status in {'queued', 'running'}
+
+    @property
+    def model_key(self):
+        return self.corpus_name, self.specs
+
+    def to_dict(self):
+        status = self.status
+        return dict(self.record, status=status, **_read_progress(self.progress_path, status))
+
+
+class BuildScheduler:
+    """
+    runs builds in separate processes and returns immediately.
+    duplicate submissions for the same specs and vocab sizes are merged,
+    and builds are queued while the estimated memory of running builds exceeds the budget.
+    builds of the same model (e.g. of all vocab sizes, and of the largest) write the same progress file, checkpoints,
+    and temporary files, so they never run at the same time - a build waits until earlier builds of its model finish.
+
+    jobs are recorded on disk, so that all worker processes of a server (see serve.py) can report their status,
+    and take builds submitted to other workers into account when merging and queueing.
+    while jobs are active, a monitor thread starts queued jobs as soon as running jobs finish,
+    so that queued jobs start even if no client polls.
+    """
+
+    def __init__(self, max_num_bytes, path):
+        self.max_num_bytes = max_num_bytes
+        self.path = path
+        self.jobs = OrderedDict()  # job_id -> job
+        self.lock = threading.Lock()
+        self.monitor = None  # started on submission, because threads do not survive forking of gunicorn workers
+        # spawn rather than fork, because the app is multi-threaded - see build_process.py
+        self.context = multiprocessing.get_context('spawn')
+
+    def submit(self, corpus_name, specs, vocab_sizes=None):
+        with self.lock:
+            self._update()
+            for job in self._get_all_jobs():
+                if job.is_active and job.model_key == (corpus_name, specs) and job.vocab_sizes == vocab_sizes:
+                    print(f'Merging submission with job {job.job_id}')
+                    return job
+            job = BuildJob(corpus_name, specs, vocab_sizes)
+            self.jobs[job.job_id] = job
+            self._save(job)
+            self._start_queued()
+            if self.monitor is None:
+                self.monitor = threading.Thread(target=self._monitor, daemon=True)
+                self.monitor.start()
+            return job
+
+    def get(self, job_id):
+        with self.lock:
+            self._update()
+            if job_id in self.jobs:
+                return self.jobs[job_id]
+        return JobRecord.load(self.path / f'{job_id}.json')  # submitted to another worker
+
+    def get_jobs(self, corpus_name):
+        with self.lock:
+            self._update()
+            return [job for job in self._get_all_jobs() if job.corpus_name == corpus_name]
+
+    def _monitor(self):
+        while True:
+            with self.lock:
+                self._update()
+                if not any(job.is_active for job in self.jobs.values()):
+                    self.monitor = None
+                    return
+                sentinels = [job.process.sentinel for job in self.jobs.values() if job.status == 'running']
+            if sentinels:  # wakes up as soon as a build process exits
+                wait(sentinels, timeout=config.Jobs.poll_interval)
+            else:  # waiting for builds submitted to other workers
+                time.sleep(config.Jobs.poll_interval)
+
+    def _get_all_jobs(self):
+        """
+        jobs submitted to this process, and to other worker processes, in order of submission
+        """
+        res = list(self.jobs.values())
+        for path in self.path.glob('*.json'):
+            if path.stem not in self.jobs:
+                record = JobRecord.load(path)
+                if record is not None:
+                    res.append(record)
+        return sorted(res, key=lambda job: job.time_submitted)
+
+    def _save(self, job):
+        save_json(self.path / f'{job.job_id}.json', job.to_record())
+
+    def _update(self):
+        for job in self.jobs.values():
+            status = job.status
+            job.update()
+            if job.status != status:
+                self._save(job)
+        self._start_queued()
+
+    def _start_queued(self):
+        all_jobs = self._get_all_jobs()
+        num_bytes = sum(job.num_bytes for job in all_jobs if job.status == 'running')
+        busy_keys = {job.model_key for job in all_jobs if job.status == 'running'}
+        for job in self.jobs.values():
+            if job.status != 'queued':
+                continue
+            if job.model_key in busy_keys:  # wait for earlier build of same model, also if that is still queued
+                continue
+            busy_keys.add(job.model_key)
+            # always start a job if nothing else is running, even if it exceeds the budget
+            if num_bytes == 0 or num_bytes + job.num_bytes <= self.max_num_bytes:
+                print(f'Starting job {job.job_id} requiring an estimated {job.num_bytes / 1e6} megabytes')
+                job.start(self.context)
+                self._save(job)
+                num_bytes += job.num_bytes
+
+
+def make_build_plan(corpus_name, specs, vocab_sizes=None):
+    builder = SimMatBuilder(Corpus(corpus_name), specs)
+    return make_plan(specs, builder.w2dfs_paths, vocab_sizes)
+
+
+def _to_progress_path(corpus_name, specs):
+    return config.LocalDirs.cache / corpus_name / (make_model_dir_name(specs) + '.progress.json')
+
+
+def _read_progress(progress_path, status):
+    progress = {}
+    if status != 'queued':  # otherwise, file may belong to a previous build
+        try:
+            with progress_path.open('r') as f:
+                progress = json.load(f)
+        except (FileNotFoundError, ValueError):  # not yet written, or file is being replaced
+            pass
+    return {'stage': progress.get('stage'),
+            'stages': progress.get('stages', SimMatBuilder.stages),
+            'stages_done': progress.get('stages_done', []),
+            'error': progress.get('error')}
+
@@ -0,0 +1,178 @@
+from contextlib import contextmanager
+from timeit import default_timer as timer
+from bisect import bisect_left
+import threading
+import resource
+import json
+import time
+import os
+
+from wikineighbors.utils import save_json
+
+
+class BuildReport:
+    """
+    records wall time, cpu time and peak memory of each stage of a build,
+    together with counters (e.g. density, worker throughput) added while a stage is running.
+    """
+
+    def __init__(self, **info):
+        self.info = info
+        self.records = []
+        self.active_records = []
+        self.time_started = time.time()
+
+    @contextmanager
+    def measure(self, stage, **counters):
+        record = dict(counters, stage=stage)
+        self.active_records.append(record)
+        wall_start = timer()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_time'] = timer() - wall_start
+            record['cpu_time'] = time.process_time() - cpu_start
+            record['peak_rss_bytes'] = get_peak_rss()
+            self.active_records.remove(record)
+            self.records.append(record)
+
+    def update(self, **counters):
+        """
+        add counters to record of current stage
+        """
+        if self.active_records:
+            self.active_records[-1].update(counters)
+
+    def to_dict(self, error=None):
+        return dict(self.info,
+                    time_started=self.time_started,
+                    wall_time=time.time() - self.time_started,
+                    peak_rss_bytes=get_peak_rss(),
+                    error=error,
+                    stages=self.records)
+
+    def save(self, path, error=None):
+        save_json(path, self.to_dict(error), indent=2)
+
+
+def get_peak_rss():
+    """
+    peak resident set size of this process in bytes (ru_maxrss is in kilobytes on Linux)
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@contextmanager
+def measure_worker(num_docs):
+    """
+    measure throughput of a worker.
+    the yielded dict is filled in on exit, and should be returned to the parent process.
+    """
+    stats = {'pid': os.getpid(), 'num_docs': num_docs}
+    wall_start = timer()
+    cpu_start = time.process_time()
+    yield stats
+    stats['wall_time'] = timer() - wall_start
+    stats['cpu_time'] = time.process_time() - cpu_start
+    stats['docs_per_sec'] = num_docs / max(stats['wall_time'], 1e-9)
+    stats['peak_rss_bytes'] = get_peak_rss()
+
+
+def summarize_workers(worker_stats):
+    """
+    counters of a stage computed from the stats returned by its workers
+    """
+    num_docs = sum(s['num_docs'] for s in worker_stats)
+    return {'num_workers': len(worker_stats),
+            'num_docs': num_docs,
+            'num_nonzeros': sum(s.get('num_nonzeros', 0) for s in worker_stats),
+            'worker_cpu_time': sum(s['cpu_time'] for s in worker_stats),
+            'docs_per_sec_per_worker': num_docs / max(sum(s['wall_time'] for s in worker_stats), 1e-9),
+            'workers': worker_stats}
+
+
+# ------------------------------------------------ Prometheus text format
+
+
+class Histogram:
+    """
+    thread-safe histogram, rendered in the Prometheus text exposition format
+    """
+
+    def __init__(self, name, documentation, label_name, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_name = label_name
+        self.buckets = sorted(buckets)
+        self.values = {}  # label value -> [bucket counts, sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self.lock:
+            counts, total, num = self.values.get(label_value, ([0] * len(self.buckets), 0.0, 0))
+            i = bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                counts[i] += 1
+            self.values[label_value] = (counts, total + value, num + 1)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} histogram']
+        with self.lock:
+            for label_value, (counts, total, num) in sorted(self.values.items()):
+                label = f'{self.label_name}="{label_value}"'
+                cumulative = 0
+                for bucket, count in zip(self.buckets, counts):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{label},le="{bucket}"}} {cumulative}')
+                lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {num}')
+                lines.append(f'{self.name}_sum{{{label}}} {total}')
+                lines.append(f'{self.name}_count{{{label}}} {num}')
+        return lines
+
+
+def render_metric(name, documentation, metric_type, samples):
+    """
+    render samples, a list of (labels, value), in the Prometheus text exposition format
+    """
+    lines = [f'# HELP {name} {documentation}',
+             f'# TYPE {name} {metric_type}']
+    for labels, value in samples:
+        label_str = ','.join(f'{k}="{v}"' for k, v in labels.items())
+        lines.append(f'{name}{{{label_str}}} {value}' if labels else f'{name} {value}')
+    return lines
+
+
+def render_build_reports(report_paths):
+    """
+    render the most recent build report of each model as gauges
+    """
+    stage_metrics = [('wall_time', 'wikineighbors_build_stage_wall_seconds', 'Wall time of build stage'),
+                     ('cpu_time', 'wikineighbors_build_stage_cpu_seconds', 'CPU time of build stage (main process)'),
+                     ('worker_cpu_time', 'wikineighbors_build_stage_worker_cpu_seconds', 'CPU time of workers'),
+                     ('peak_rss_bytes', 'wikineighbors_build_stage_peak_rss_bytes', 'Peak RSS at end of stage'),
+                     ('docs_per_sec_per_worker', 'wikineighbors_build_docs_per_second_per_worker',
+                      'Documents processed per second by each worker'),
+                     ('density', 'wikineighbors_build_term_doc_density', 'Fraction of non-zeros in term-by-doc matrix')]
+    samples = {key: [] for key, _, _ in stage_metrics}
+    for path in report_paths:
+        try:
+            with path.open('r') as f:
+                report = json.load(f)
+        except (FileNotFoundError, ValueError):  # removed, or is being replaced
+            continue
+        for record in report['stages']:
+            labels = {'corpus': report['corpus_name'],
+                      'model': report['vocab_name'],
+                      'stage': record['stage']}
+            if 'vocab_size' in record:
+                labels['vocab_size'] = record['vocab_size']
+            for key in samples:
+                if key in record:
+                    samples[key].append((labels, record[key]))
+
+    lines = []
+    for key, name, documentation in stage_metrics:
+        lines += render_metric(name, documentation, 'gauge', samples[key])
+    return lines
@@ -0,0 +1,110 @@
+import itertools
+import json
+import csv
+import io
+import numpy as np
+
+from wikineighbors import config
+
+input_formats = ('tsv', 'ndjson')
+output_formats = ('ndjson', 'csv')
+field_names = ['word1', 'word2', 'sim', 'oov', 'error']
+
+
+def iter_pairs(lines, input_format):
+    """
+    yield (word1, word2, error) for each pair of words in lines, without reading all lines at once.
+
+    tsv: words separated by tabs on each line, e.g. doctor<TAB>nurse.
+    ndjson: a JSON array of words on each line, or an object with "words" or with "word1" and "word2".
+    a line with more than two words is a word list, and all pairs of its words are yielded.
+    """
+    for line_number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            words = _parse_line(line, input_format)
+        except (ValueError, KeyError, TypeError):
+            yield None, None, f'Could not parse line {line_number}'
+            continue
+        if len(words) < 2:
+            yield (words[0] if words else None), None, f'Expected at least 2 words on line {line_number}'
+        for word1, word2 in itertools.combinations(words, 2):
+            yield word1, word2, None
+
+
+def _parse_line(line, input_format):
+    if input_format == 'tsv':
+        return [w.strip() for w in line.split('\t')]
+    elif input_format == 'ndjson':
+        record = json.loads(line)
+        if isinstance(record, dict):
+            record = record['words'] if 'words' in record else [record['word1'], record['word2']]
+        if not isinstance(record, list):
+            raise TypeError('Expected a list of words')
+        return [str(w) for w in record]
+    else:
+        raise AttributeError('Invalid input format')
+
+
+def stream_pair_sims(responder, pairs, num_pairs_per_batch=config.Max.num_pairs_per_batch):
+    """
+    yield a list of results for each batch of pairs, so that memory does not depend on the number of pairs.
+    ids of all words in a batch are looked up at once,
+    and the embeddings of distinct words in a batch are gathered (read from disk) once.
+    """
+    pairs = iter(pairs)
+    while True:
+        batch = list(itertools.islice(pairs, num_pairs_per_batch))
+        if not batch:
+            return
+        ids1 = responder.vocab.lookup([word1 or '' for word1, _, _ in batch])
+        ids2 = responder.vocab.lookup([word2 or '' for _, word2, _ in batch])
+        is_valid = (ids1 != -1) & (ids2 != -1)
+        sims = np.full(len(batch), np.nan)
+        if is_valid.any():
+            unique_ids, inverse = np.unique(np.concatenate([ids1[is_valid], ids2[is_valid]]), return_inverse=True)
+            vectors = np.asarray(responder.embeddings[unique_ids])  # sorted ids, so pages are read in order
+            rows1, rows2 = np.split(inverse, 2)
+            sims[is_valid] = np.einsum('ij,ij->i', vectors[rows1], vectors[rows2])  # embeddings are L2-normalized
+
+        res = []
+        for (word1, word2, error), id1, id2, sim in zip(batch, ids1.tolist(), ids2.tolist(), sims.tolist()):
+            oov = [w for w, i in [(word1, id1), (word2, id2)] if w is not None and i == -1]
+            res.append({'word1': word1,
+                        'word2': word2,
+                        'sim': None if np.isnan(sim) else sim,
+                        'oov': oov,
+                        'error': error})
+        yield res
+
+
+def format_ndjson(batches):
+    for batch in batches:
+        yield ''.join(json.dumps(res) + '\n' for res in batch)
+
+
+def format_csv(batches):
+    """
+    out-of-vocabulary words are separated by spaces, and missing values are empty
+    """
+    f = io.StringIO()
+    writer = csv.DictWriter(f, fieldnames=field_names)
+    writer.writeheader()
+    for batch in batches:
+        writer.writerows(dict(res, oov=' '.join(res['oov'])) for res in batch)
+        yield f.getvalue()  # includes header, if this is the first batch
+        f.seek(0)
+        f.truncate()
+
+
+def format_pair_sims(batches, output_format):
+    if output_format == 'ndjson':
+        return format_ndjson(batches)
+    elif output_format == 'csv':
+        return format_csv(batches)
+    else:
+        raise AttributeError('Invalid output format')
@@ -0,0 +1,154 @@
+import attr
+import shutil
+import os
+import tempfile
+import numpy as np
+from pathlib import Path
+
+from wikineighbors.shards import Shard
+from wikineighbors import config
+
+
+@attr.s
+class BuildPlan:
+    """
+    strategy for building a model, chosen before the build starts.
+    estimates contain the peak memory of each stage for each mode (strategy), in bytes.
+    """
+    mode = attr.ib()
+    num_jobs = attr.ib()
+    fits = attr.ib()
+    available_bytes = attr.ib()
+    budget_bytes = attr.ib()
+    estimates = attr.ib()
+
+    @property
+    def num_bytes(self):
+        return self.estimates[self.mode]['peak_bytes']
+
+    def to_dict(self):
+        return dict(attr.asdict(self), num_bytes=self.num_bytes)
+
+
+def make_plan(specs, w2dfs_paths, vocab_sizes=None, available_bytes=None):
+    """
+    estimate peak memory of each mode, and choose the first mode in config.Planner.modes that fits into memory.
+    the number of workers is reduced until the shards loaded by all workers at the same time fit.
+    if nothing fits, the mode requiring the least memory is chosen, and the plan is marked as not fitting.
+    """
+    if available_bytes is None:
+        available_bytes = get_available_bytes()
+    budget_bytes = int(available_bytes * config.Planner.memory_fraction)
+    vocab_size = max(vocab_sizes or [specs.vocab_size])
+    shard_sizes = [get_shard_size(p, specs.corpus_size // len(w2dfs_paths)) for p in w2dfs_paths]
+
+    if config.Sims.term_doc_mode == 'auto':
+        modes = config.Planner.modes
+    else:
+        modes = [config.Sims.term_doc_mode]
+    estimates = {mode: estimate_stages(mode, vocab_size, specs.corpus_size, shard_sizes, budget_bytes)
+                 for mode in modes}
+
+    for mode in modes:
+        if estimates[mode]['fits']:
+            return BuildPlan(mode, estimates[mode]['num_jobs'], True, available_bytes, budget_bytes, estimates)
+    mode = min(modes, key=lambda m: estimates[m]['peak_bytes'])
+    return BuildPlan(mode, estimates[mode]['num_jobs'], False, available_bytes, budget_bytes, estimates)
+
+
+def estimate_stages(mode, vocab_size, num_docs, shard_sizes, budget_bytes):
+    """
+    peak memory of each stage of a build, in bytes.
+    estimates are conservative: every entry (word-document pair) in a shard is assumed to be in the vocab.
+    """
+    num_dims = config.Sims.num_svd_dimensions
+    num_entries = sum(s['num_entries'] for s in shard_sizes)
+    num_nonzeros = min(num_entries, vocab_size * num_docs)
+    gram_bytes = vocab_size ** 2 * np.dtype(np.float64).itemsize
+    # ARPACK holds a Lanczos basis of max(2 * num_dims + 1, 20) float64 vectors along the shorter side of the matrix,
+    # and then a few float64 matrices with num_dims columns (singular vectors of both sides, and their copies)
+    num_lanczos_vectors = max(2 * num_dims + 1, 20)
+    svd_bytes = (num_lanczos_vectors * min(vocab_size, num_docs)
+                 + 3 * (vocab_size + num_docs) * num_dims) * np.dtype(np.float64).itemsize
+    embeddings_bytes = vocab_size * num_dims * np.dtype(np.float64).itemsize
+
+    # each worker loads one shard, and maps each entry to a row (int64) and a mask, and returns triplets
+    worker_bytes = max(s['num_bytes'] + s['num_entries'] * (8 + 1 + 4 + 4 + 4 + 2) for s in shard_sizes)
+    if mode == 'gram':
+        worker_bytes += vocab_size ** 2 * (8 + 4)  # partial Gram matrix (csr) - worst case is dense
+        held_bytes = 2 * gram_bytes  # accumulator and partial result received from worker
+        svd_stage_bytes = 3 * gram_bytes  # accumulator, copy made by eigh and its workspace
+    elif mode == 'sparse':
+        held_bytes = num_nonzeros * (4 + 4 + 2) * 2 + num_nonzeros * 8  # triplets, concatenated copy, int64 cols
+        svd_stage_bytes = num_nonzeros * ((4 + 2) + (4 + 8)) + svd_bytes  # int16 csr and float64 copy
+    elif mode == 'dense':
+        held_bytes = 0  # matrix is mem-mapped from disk, and its pages can be evicted by the OS
+        svd_stage_bytes = num_nonzeros * (8 + 8 + 2) + svd_bytes  # conversion of dense matrix to csr
+    else:
+        raise AttributeError('Invalid arg to config.Sims.term_doc_mode')
+
+    # use as many workers as fit into the remaining memory
+    num_jobs = int(np.clip((budget_bytes - held_bytes) // max(worker_bytes, 1), 1, config.Sims.num_jobs))
+    stages = {'counting': max(s['num_bytes'] for s in shard_sizes),
+              'term-doc': held_bytes + num_jobs * worker_bytes,
+              'svd': svd_stage_bytes,
+              'save': 2 * embeddings_bytes}
+    if config.NeighborTable.is_built:  # table, and similarities of one block and tile per worker
+        stages['neighbors'] = (vocab_size * config.Max.num_neighbors * (4 + 4) +
+                               num_jobs * config.NeighborTable.block_size * config.NeighborTable.tile_size * 8 * 2)
+    peak_bytes = max(stages.values())
+
+    # checkpoints of term-doc stage: mem-mapped matrix, triplets of each shard, or accumulated Gram matrix
+    if mode == 'dense':
+        disk_bytes = vocab_size * num_docs * np.dtype(np.int16).itemsize
+    elif mode == 'sparse':
+        disk_bytes = num_nonzeros * (8 + 4 + 2)
+    else:
+        disk_bytes = gram_bytes if config.Checkpoints.is_enabled else 0
+    free_disk_bytes = get_free_disk_bytes()
+    return {'stages': stages,
+            'peak_bytes': peak_bytes,
+            'num_jobs': num_jobs,
+            'disk_bytes': disk_bytes,
+            'fits': peak_bytes <= budget_bytes and disk_bytes <= free_disk_bytes}
+
+
+def get_shard_size(path, num_docs):
+    """
+    number of entries and bytes in memory of a shard, without loading it.
+    the size of a pickle file is only known on disk, so its size in memory is extrapolated from its file size.
+    """
+    if path.is_dir():
+        shard = Shard.load(path)  # only headers are read because arrays are memory-mapped
+        return {'num_docs': shard.num_docs,
+                'num_entries': len(shard.word_ids),
+                'num_bytes': sum(arr.nbytes for arr in [shard.words, shard.offsets, shard.word_ids, shard.counts])}
+    else:
+        num_entries = path.stat().st_size // config.Planner.pickle_bytes_per_entry
+        return {'num_docs': num_docs,
+                'num_entries': num_entries,
+                'num_bytes': num_entries * config.Planner.unpickled_bytes_per_entry}
+
+
+def get_free_disk_bytes():
+    """
+    free space where checkpoints are saved (local cache, or temporary directory if checkpoints are not kept)
+    """
+    path = config.LocalDirs.cache if config.Checkpoints.is_enabled else Path(tempfile.gettempdir())
+    while not path.exists():  # cache is created by first build
+        path = path.parent
+    return shutil.disk_usage(str(path)).free
+
+
+def get_available_bytes():
+    """
+    memory that can be allocated without swapping (MemAvailable on Linux)
+    """
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except FileNotFoundError:  # not Linux
+        pass
+    return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
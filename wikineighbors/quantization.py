@@ -0,0 +1,106 @@
+import numpy as np
+
+from wikineighbors.ann import _top_k_2d, exact_search
+from wikineighbors.utils import to_batch_size
+
+
+class QuantizedEmbeddings:
+    """
+    embeddings stored as int8 or float16 codes with one float32 scale per row (row = codes * scale).
+
+    approximate similarities are computed on the codes, which are small enough to stay resident for many models.
+    the most similar candidates are then re-ranked exactly with the float64 embeddings,
+    of which only the rows of candidates are read from disk (embeddings are memory-mapped).
+    """
+
+    array_names = ('embeddings_codes', 'embeddings_scales')
+
+    def __init__(self, codes, scales):
+        self.codes = codes
+        self.scales = scales
+
+    @classmethod
+    def build(cls, embeddings, dtype):
+        dtype = np.dtype(dtype)
+        max_abs = np.abs(embeddings).max(axis=1)
+        max_abs[max_abs == 0] = 1
+        if dtype == np.int8:
+            scales = max_abs / np.iinfo(np.int8).max
+            codes = np.round(embeddings / scales[:, np.newaxis]).astype(np.int8)
+        elif dtype == np.float16:
+            scales = max_abs
+            codes = (embeddings / scales[:, np.newaxis]).astype(np.float16)
+        else:
+            raise AttributeError('Invalid arg to config.Quantization.dtype')
+        return cls(codes, scales.astype(np.float32))
+
+    def to_arrays(self):
+        return dict(zip(self.array_names, [self.codes, self.scales]))
+
+    @property
+    def num_bytes(self):
+        return self.codes.nbytes + self.scales.nbytes
+
+    def approximate_sims(self, vectors):
+        """
+        return approximate similarities with shape (len(vectors), vocab size).
+        codes are converted to float32 one tile of rows at a time, into a buffer that is re-used for each tile,
+        so that a float32 copy of all codes (larger than the codes themselves) is never made.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        res = np.empty((len(vectors), len(self.codes)), dtype=np.float32)
+        tile_size = min(to_batch_size(self.codes.shape[1], itemsize=4), len(self.codes))
+        tile = np.empty((tile_size, self.codes.shape[1]), dtype=np.float32)
+        for start in range(0, len(self.codes), tile_size):
+            codes = self.codes[start: start + tile_size]
+            np.copyto(tile[:len(codes)], codes)
+            np.matmul(vectors, tile[:len(codes)].T, out=res[:, start: start + len(codes)])
+        res *= self.scales
+        return res
+
+    def search(self, embeddings, query_ids, k, num_candidates):
+        """
+        return arrays with shape (len(query_ids), k) of nearest neighbors (excluding query itself)
+        and their exact similarities, sorted from most to least similar
+        """
+        num_candidates = min(max(num_candidates, k), len(self.codes) - 1)
+        res_ids = np.zeros((len(query_ids), k), dtype=int)
+        res_sims = np.zeros((len(query_ids), k))
+        batch_size = to_batch_size(len(self.codes), itemsize=4)  # approximate similarities are float32
+        for start in range(0, len(query_ids), batch_size):
+            batch_ids = np.asarray(query_ids[start: start + batch_size])
+            queries = np.asarray(embeddings[batch_ids])
+            sims = self.approximate_sims(queries)
+            sims[np.arange(len(batch_ids)), batch_ids] = -np.inf  # exclude query itself
+            candidates = _top_k_2d(sims, num_candidates)
+
+            # re-rank candidates exactly - only rows of candidates are read
+            exact_sims = np.einsum('ij,ikj->ik', queries, np.asarray(embeddings[candidates]))
+            top = _top_k_2d(exact_sims, k)
+            res_ids[start: start + len(batch_ids)] = np.take_along_axis(candidates, top, axis=1)
+            res_sims[start: start + len(batch_ids)] = np.take_along_axis(exact_sims, top, axis=1)
+        return res_ids, res_sims
+
+
+def evaluate_quantization(quantized, embeddings, k, num_candidates, num_queries, seed=0):
+    """
+    compare top-k neighbors after re-ranking with exact top-k neighbors of float64 embeddings
+    """
+    rng = np.random.default_rng(seed)
+    query_ids = rng.choice(len(embeddings), min(num_queries, len(embeddings)), replace=False)
+    k = min(k, len(embeddings) - 1)
+
+    batch_size = to_batch_size(len(embeddings))
+    exact_ids = np.concatenate([exact_search(embeddings, query_ids[i: i + batch_size], k)
+                                for i in range(0, len(query_ids), batch_size)])
+    approx_ids, _ = quantized.search(embeddings, query_ids, k, num_candidates)
+    num_found = sum(len(np.intersect1d(a, e)) for a, e in zip(approx_ids, exact_ids))
+    max_sim_error = 0.0
+    for start in range(0, len(query_ids), batch_size):
+        queries = embeddings[query_ids[start: start + batch_size]]
+        sim_errors = np.abs(quantized.approximate_sims(queries) - queries @ embeddings.T)
+        max_sim_error = max(max_sim_error, float(sim_errors.max()))
+    return {'recall': num_found / (len(query_ids) * k),
+            'num_identical': int(np.sum(np.all(approx_ids == exact_ids, axis=1))),
+            'num_queries': len(query_ids),
+            'max_approximate_sim_error': max_sim_error}
@@ -0,0 +1,93 @@
+from collections import OrderedDict
+import threading
+
+from wikineighbors.responder import Responder
+from wikineighbors.file_names import make_model_dir_name
+
+
+class ModelRegistry:
+    """
+    keeps loaded models (responders) across requests.
+    least-recently-used models are evicted when the total size of loaded arrays exceeds the budget,
+    and models are re-loaded when their files change on disk.
+    """
+
+    def __init__(self, max_num_bytes):
+        self.max_num_bytes = max_num_bytes
+        self.responders = OrderedDict()  # (corpus name, specs) -> (responder, time modified)
+        self.lock = threading.Lock()
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_evictions = 0
+        self.num_invalidations = 0
+
+    def get(self, corpus, specs):
+        key = (corpus.name, specs)
+        responder = Responder(corpus, specs)
+        time_modified = responder.time_modified
+        with self.lock:
+            if key in self.responders:
+                cached_responder, cached_time_modified = self.responders[key]
+                if cached_time_modified == time_modified:
+                    self.num_hits += 1
+                    self.responders.move_to_end(key)
+                    return cached_responder
+                else:  # model was re-built
+                    self.num_invalidations += 1
+                    del self.responders[key]
+            self.num_misses += 1
+
+        if time_modified is None:  # not built - responder raises an informative error when used
+            return responder
+
+        # load outside lock because loading can be slow
+        responder.load()
+        with self.lock:
+            self.responders[key] = (responder, time_modified)
+            self.responders.move_to_end(key)
+            self._evict()
+        return responder
+
+    def preload(self, corpus, specs):
+        """
+        load a model and read its arrays before serving requests.
+        if called before worker processes are forked, all workers share the loaded model.
+        """
+        responder = self.get(corpus, specs)
+        if responder.time_modified is None:
+            print(f'Did not preload {corpus.name}/{make_model_dir_name(specs)} because it was not built')
+            return None
+        responder.warm_up()
+        print(f'Preloaded {corpus.name}/{make_model_dir_name(specs)} ({responder.num_bytes / 1e6} megabytes)')
+        return responder
+
+    def get_from_session(self, session, corpus):
+        specs = Responder.specs_from_session(session, corpus)
+        return self.get(corpus, specs)
+
+    def _evict(self):
+        # the most recently used model is never evicted
+        while self.num_bytes > self.max_num_bytes and len(self.responders) > 1:
+            key, _ = self.responders.popitem(last=False)
+            self.num_evictions += 1
+            print(f'Evicted model {key} from registry')
+
+    @property
+    def num_bytes(self):
+        return sum(responder.num_bytes for responder, _ in self.responders.values())
+
+    def clear(self):
+        with self.lock:
+            self.responders.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'num_models': len(self.responders),
+                    'num_bytes': self.num_bytes,
+                    'max_num_bytes': self.max_num_bytes,
+                    'num_hits': self.num_hits,
+                    'num_misses': self.num_misses,
+                    'num_evictions': self.num_evictions,
+                    'num_invalidations': self.num_invalidations,
+                    'models': ['{}/{}'.format(name, make_model_dir_name(specs)) for name, specs in self.responders]}
+
@@ -1,11 +1,17 @@
 from cached_property import cached_property
-import pickle
+import numpy as np
+import mmap
 
 from wikineighbors.specs import Specs
 
 from wikineighbors.exceptions import WikiNeighborsNoVocabFound
 from wikineighbors.exceptions import WikiNeighborsNoSpecs
-from wikineighbors.file_names import make_cached_file_name
+from wikineighbors.file_names import make_model_dir_name
+from wikineighbors.artifacts import load_manifest, load_array
+from wikineighbors.ann import IVFIndex
+from wikineighbors.quantization import QuantizedEmbeddings
+from wikineighbors.vocab import Vocab
+from wikineighbors.utils import to_batch_size
 from wikineighbors import config
 
 
@@ -18,25 +24,81 @@ class Responder:
         self.corpus = corpus
         self.cache_path = config.LocalDirs.cache / corpus.name
         self.specs = specs
-        self.vocab_file_name = make_cached_file_name('vocab', specs)
-        self.sim_mat_file_name = make_cached_file_name('sim_mat', specs)
+        self.model_path = self.cache_path / make_model_dir_name(specs)
+
+    @staticmethod
+    def specs_from_session(session, corpus):
+        vocab_name = session.get(corpus.name)
+        if vocab_name is None:  # user has not previously selected specs for corpus
+            raise WikiNeighborsNoSpecs(corpus.name)
+        return Specs(*vocab_name.split(corpus.separator))
 
     @classmethod
     def load_from_session(cls, session, corpus):
-        try:
-            vocab_name = session.get(corpus.name)
-        except KeyError:  # user has not previously selected specs for corpus
-            raise WikiNeighborsNoSpecs(corpus.name)
-        specs = Specs(*vocab_name.split(corpus.separator))
+        specs = cls.specs_from_session(session, corpus)
         return cls(corpus, specs)
 
-    @cached_property
-    def w2id(self):
-        return {w: i for i, w in enumerate(self.vocab)}
+    @property
+    def time_modified(self):
+        """
+        time model was last saved, or None if it was not built
+        """
+        manifest_path = self.model_path / config.Artifacts.manifest_file_name
+        try:
+            return manifest_path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def load(self):
+        """
+        load everything required for answering requests
+        """
+        return self.vocab, self.embeddings, self.ann_index, self.quantized, self.neighbor_table
+
+    def warm_up(self):
+        """
+        read each page of arrays that are read in full while answering requests (see num_bytes).
+        arrays are memory-mapped, so their pages are held once in the OS page cache,
+        and are shared by all processes mapping them (e.g. workers forked after loading).
+        """
+        arrays = list(self.vocab.to_arrays().values())
+        if self.quantized is not None:
+            arrays += list(self.quantized.to_arrays().values())
+        else:
+            arrays.append(self.embeddings)
+        if self.ann_index is not None:
+            arrays += list(self.ann_index.to_arrays().values())
+        for arr in arrays:
+            np.asarray(arr).reshape(-1).view(np.uint8)[::mmap.PAGESIZE].sum()  # touches one byte per page
+
+    @property
+    def num_bytes(self):
+        """
+        size of arrays that are read in full while answering requests.
+        if a model has quantized embeddings, only few rows of the memory-mapped float64 embeddings are read.
+        """
+        res = self.vocab.num_bytes
+        if self.quantized is not None:
+            res += self.quantized.num_bytes
+        else:
+            res += self.embeddings.nbytes
+        if self.ann_index is not None:
+            res += self.ann_index.num_bytes
+        return res
+
+    def to_ids(self, words):
+        """
+        return array of vocab ids, raising KeyError if a word is not in vocab
+        """
+        res = self.vocab.lookup(words)
+        is_oov = res == -1
+        if is_oov.any():
+            raise KeyError(words[int(np.argmax(is_oov))])
+        return res
 
     def get_sims(self, word, other_words):
-        other_ids = [self.w2id[w] for w in other_words]
-        res = self.sim_mat[self.w2id[word], other_ids]
+        other_ids = self.to_ids(other_words)
+        res = self.embeddings[other_ids] @ self.embeddings[self.vocab.index(word)]
         return res
 
     def get_neighbors(self, word):
@@ -44,15 +106,78 @@ class Responder:
             raise WikiNeighborsNoVocabFound(self.corpus.name)
 
         print('Computing neighbors...')
-        sims = self.sim_mat[self.w2id[word]]
-        res = [(w, s) for w, s in sorted(zip(self.vocab, sims), key=lambda i: i[1])
+        sims = self.embeddings @ self.embeddings[self.vocab.index(word)]  # embeddings are L2-normalized
+        res = [(w, s) for w, s in sorted(zip(self.vocab.words, sims), key=lambda i: i[1])
                if w != word]
         return zip(*res)  # unpack [(w, s), ...(w, s)] to [w, ...w], [s, ..., s]
 
+    def get_top_neighbors(self, word, k):
+        """
+        return k nearest neighbors of word and their similarities, sorted from most to least similar.
+        only the top k similarities are sorted.
+        """
+        neighbors, sims = self.get_top_neighbors_batch([word], k)
+        return neighbors[0].tolist(), sims[0]
+
+    def get_top_neighbors_batch(self, words, k, exact=False):
+        """
+        return arrays with shape (len(words), k) of nearest neighbors and their similarities.
+        neighbors are read from the neighbor table if the model has one.
+        otherwise, similarity rows are computed with one matrix multiply per batch of words,
+        unless the model has an approximate nearest-neighbor index or quantized embeddings.
+        """
+        if not self.corpus.cached_vocab_names:
+            raise WikiNeighborsNoVocabFound(self.corpus.name)
+
+        word_ids = self.to_ids(words)
+        k = max(0, min(k, len(self.vocab) - 1))
+        res_ids = np.zeros((len(word_ids), k), dtype=int)
+        res_sims = np.zeros((len(word_ids), k))
+        if k == 0:
+            return self.vocab[res_ids], res_sims
+
+        if self.neighbor_table is not None and k <= self.neighbor_table[0].shape[1] and not exact:
+            table_ids, table_sims = self.neighbor_table
+            return self.vocab[table_ids[word_ids, :k]], table_sims[word_ids, :k].astype(np.float64)
+
+        if self.ann_index is not None and not exact:
+            num_probes = self.manifest['build']['ann']['num_probes']
+            res_ids, res_sims = self.ann_index.search(self.embeddings, word_ids, k, num_probes)
+            return self.vocab[res_ids], res_sims
+
+        if self.quantized is not None and not exact:
+            num_candidates = self.manifest['build']['quantization']['num_candidates']
+            res_ids, res_sims = self.quantized.search(self.embeddings, word_ids, k, num_candidates)
+            return self.vocab[res_ids], res_sims
+
+        batch_size = to_batch_size(len(self.embeddings))
+        for start in range(0, len(word_ids), batch_size):
+            batch_ids = word_ids[start: start + batch_size]
+            rows = np.arange(len(batch_ids))
+            sims = self.embeddings[batch_ids] @ self.embeddings.T
+            sims[rows, batch_ids] = -np.inf  # exclude word itself
+            top_ids = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+            top_sims = np.take_along_axis(sims, top_ids, axis=1)
+            order = np.argsort(-top_sims, axis=1)
+            res_ids[start: start + len(batch_ids)] = np.take_along_axis(top_ids, order, axis=1)
+            res_sims[start: start + len(batch_ids)] = np.take_along_axis(top_sims, order, axis=1)
+
+        return self.vocab[res_ids], res_sims
+
+    def get_sims_block(self, words):
+        """
+        return pairwise similarities between all words
+        """
+        word_ids = self.to_ids(words)
+        vectors = self.embeddings[word_ids]
+        return vectors @ vectors.T
+
+    @cached_property
+    def manifest(self):
+        return load_manifest(self.model_path)
+
     def load_vocab(self):
-        with (self.cache_path / self.vocab_file_name).open('rb') as f:
-            res = pickle.load(f)
-        return res
+        return Vocab(*[load_array(self.model_path, self.manifest, name) for name in Vocab.array_names])
 
     @cached_property
     def vocab(self):
@@ -61,14 +186,41 @@ class Responder:
         else:
             return self.load_vocab()
 
-    def load_sim_mat(self):
-        with (self.cache_path / self.sim_mat_file_name).open('rb') as f:
-            res = pickle.load(f)
-        return res
+    def load_embeddings(self):
+        return load_array(self.model_path, self.manifest, 'embeddings')
 
     @cached_property
-    def sim_mat(self):
+    def embeddings(self):
         if not self.corpus.cached_vocab_names:
             raise WikiNeighborsNoVocabFound(self.corpus.name)
         else:
-            return self.load_sim_mat()
\ No newline at end of file
+            return self.load_embeddings()
+
+    @cached_property
+    def ann_index(self):
+        """
+        approximate nearest-neighbor index, or None if model was built without one
+        """
+        if IVFIndex.array_names[0] not in self.manifest['arrays']:
+            return None
+        return IVFIndex(*[load_array(self.model_path, self.manifest, name) for name in IVFIndex.array_names])
+
+    @cached_property
+    def quantized(self):
+        """
+        compact embeddings, or None if model was built without them
+        """
+        if QuantizedEmbeddings.array_names[0] not in self.manifest['arrays']:
+            return None
+        return QuantizedEmbeddings(*[load_array(self.model_path, self.manifest, name)
+                                     for name in QuantizedEmbeddings.array_names])
+
+    @cached_property
+    def neighbor_table(self):
+        """
+        ids and similarities of nearest neighbors of each word, or None if model was built without them
+        """
+        if 'neighbor_ids' not in self.manifest['arrays']:
+            return None
+        return (load_array(self.model_path, self.manifest, 'neighbor_ids'),
+                load_array(self.model_path, self.manifest, 'neighbor_sims'))
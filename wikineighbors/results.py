@@ -0,0 +1,92 @@
+from collections import OrderedDict
+import threading
+
+from wikineighbors.file_names import make_model_dir_name
+
+
+class ResultCache:
+    """
+    keeps neighbor lists of single words and similarity tables of word sets across requests,
+    so that viewing the same words again does not compute similarities again.
+    least-recently-used results are evicted when their number exceeds the budget,
+    and all results of a model are dropped when the model is re-built.
+    """
+
+    def __init__(self, max_num_results):
+        self.max_num_results = max_num_results
+        self.results = OrderedDict()  # (corpus name, specs, kind, args) -> result
+        self.times_modified = {}  # (corpus name, specs) -> time modified of model that results were computed with
+        self.lock = threading.Lock()
+        self.num_hits = 0
+        self.num_misses = 0
+        self.num_evictions = 0
+        self.num_invalidations = 0
+
+    def get_top_neighbors(self, responder, word, k):
+        """
+        return list of (neighbor, similarity) pairs, with similarities rounded for display
+        """
+        def compute():
+            neighbors, sims = responder.get_top_neighbors(word, k)
+            return [(n, round(float(s), 2)) for n, s in zip(neighbors, sims)]
+
+        return self._get(responder, ('neighbors', word, k), compute)
+
+    def get_sims_block(self, responder, words):
+        """
+        return similarities between all pairs of words as nested lists, rounded for display
+        """
+        def compute():
+            return [[round(float(s), 2) for s in row] for row in responder.get_sims_block(words)]
+
+        return self._get(responder, ('sims', tuple(words)), compute)
+
+    def _get(self, responder, args, compute):
+        model_key = (responder.corpus.name, responder.specs)
+        key = model_key + args
+        time_modified = responder.time_modified
+        with self.lock:
+            if self.times_modified.get(model_key, time_modified) != time_modified:  # model was re-built
+                self._invalidate(model_key)
+            if key in self.results:
+                self.num_hits += 1
+                self.results.move_to_end(key)
+                return self.results[key]
+            self.num_misses += 1
+
+        # compute outside lock because computing can be slow
+        res = compute()
+        with self.lock:
+            self.times_modified[model_key] = time_modified
+            self.results[key] = res
+            self.results.move_to_end(key)
+            self._evict()
+        return res
+
+    def _invalidate(self, model_key):
+        for key in [key for key in self.results if key[:2] == model_key]:
+            del self.results[key]
+            self.num_invalidations += 1
+        del self.times_modified[model_key]
+
+    def _evict(self):
+        while len(self.results) > self.max_num_results:
+            self.results.popitem(last=False)
+            self.num_evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+            self.times_modified.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'num_results': len(self.results),
+                    'max_num_results': self.max_num_results,
+                    'num_hits': self.num_hits,
+                    'num_misses': self.num_misses,
+                    'num_evictions': self.num_evictions,
+                    'num_invalidations': self.num_invalidations,
+                    'models': ['{}/{}'.format(name, make_model_dir_name(specs))
+                               for name, specs in self.times_modified]}
+
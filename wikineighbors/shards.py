@@ -0,0 +1,102 @@
+import numpy as np
+import pickle
+import shutil
+from collections import Counter
+from pathlib import Path
+
+
+class Shard:
+    """
+    columnar, memory-mappable storage of a list of w2dfs (one word-to-frequency dict per document).
+
+    a shard is saved as a directory containing:
+    words.npy: sorted string table with each word in the shard occurring once
+    offsets.npy: CSR-style offsets, entries of document i are at offsets[i]:offsets[i + 1]
+    word_ids.npy: index into words for each entry
+    counts.npy: frequency of word in document for each entry
+    """
+
+    file_names = ('words.npy', 'offsets.npy', 'word_ids.npy', 'counts.npy')
+
+    def __init__(self, words, offsets, word_ids, counts):
+        self.words = words
+        self.offsets = offsets
+        self.word_ids = word_ids
+        self.counts = counts
+
+    @classmethod
+    def from_w2dfs(cls, w2dfs):
+        words = np.array(sorted({w for w2df in w2dfs for w in w2df}))
+        w2id = {w: n for n, w in enumerate(words.tolist())}
+        offsets = np.cumsum([0] + [len(w2df) for w2df in w2dfs], dtype=np.int64)
+        word_ids = np.fromiter((w2id[w] for w2df in w2dfs for w in w2df), dtype=np.int32, count=offsets[-1])
+        counts = np.fromiter((f for w2df in w2dfs for f in w2df.values()), dtype=np.int32, count=offsets[-1])
+        return cls(words, offsets, word_ids, counts)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        load a shard directory with zero-copy memory-mapping,
+        or fall back to converting a pickled list of w2dfs in memory.
+        """
+        if path.is_dir():
+            return cls(*[np.load(path / file_name, mmap_mode=mmap_mode) for file_name in cls.file_names])
+        else:
+            with path.open('rb') as f:
+                w2dfs = pickle.load(f)
+            return cls.from_w2dfs(w2dfs)
+
+    def save(self, path):
+        # write to a temporary directory first so that readers never see an incomplete shard
+        tmp_path = path.parent / (path.name + '.tmp')
+        if tmp_path.exists():
+            shutil.rmtree(str(tmp_path))
+        tmp_path.mkdir(parents=True)
+        for file_name, arr in zip(self.file_names, [self.words, self.offsets, self.word_ids, self.counts]):
+            np.save(tmp_path / file_name, arr)
+        tmp_path.rename(path)
+
+    @property
+    def num_docs(self):
+        return len(self.offsets) - 1
+
+    @property
+    def doc_ids(self):
+        return np.repeat(np.arange(self.num_docs, dtype=np.int32), np.diff(self.offsets))
+
+    def count_words(self):
+        """
+        return word to corpus-frequency mapping for all words in shard
+        """
+        totals = np.bincount(self.word_ids, weights=self.counts, minlength=len(self.words))
+        return Counter(dict(zip(self.words.tolist(), totals.astype(np.int64).tolist())))
+
+    def map_words(self, vocab):
+        """
+        return an array mapping each word id in the shard to its index in vocab, or -1 if not in vocab
+        """
+        vocab = np.asarray(vocab)
+        res = np.full(len(self.words), -1, dtype=np.int32)
+        if len(self.words) == 0:
+            return res
+        positions = np.searchsorted(self.words, vocab).clip(max=len(self.words) - 1)
+        is_found = self.words[positions] == vocab
+        res[positions[is_found]] = np.arange(len(vocab), dtype=np.int32)[is_found]
+        return res
+
+
+def convert_w2dfs(w2dfs_path, overwrite=False):
+    """
+    one-time conversion of a pickled list of w2dfs to a shard directory next to it
+    """
+    shard_path = w2dfs_path.parent / w2dfs_path.stem
+    if shard_path.exists():
+        if not overwrite:
+            print(f'Skipping {w2dfs_path} - already converted')
+            return shard_path
+        shutil.rmtree(str(shard_path))
+
+    shard = Shard.load(Path(w2dfs_path))
+    shard.save(shard_path)
+    print(f'Converted {shard.num_docs} w2dfs in {w2dfs_path} to {shard_path}')
+    return shard_path
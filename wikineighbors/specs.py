@@ -1,7 +1,7 @@
 import attr
 
 
-@attr.s
+@attr.s(frozen=True)  # hashable, so it can be used as a key
 class Specs(object):
     vocab_size = attr.ib(converter=int)
     corpus_size = attr.ib(converter=int)
@@ -0,0 +1,226 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import threading
+import fcntl
+import hashlib
+import shutil
+import json
+import time
+import os
+
+from wikineighbors.utils import stat_files, is_process_alive, save_json
+from wikineighbors import config
+
+
+class ShardStager:
+    """
+    copies shards (converted or pickled w2dfs) from the file server to local disk, and re-uses copies across builds.
+
+    a copy is re-used if size and time modified of each remote file are unchanged,
+    so that repeat builds touch the network only to validate freshness.
+    a checksum is computed while copying, and local copies can be verified against it before they are re-used.
+    copies are pulled in the background while earlier shards are being processed,
+    and least-recently used copies are removed when the total size of copies exceeds the quota.
+
+    copies in use are pinned with a marker file named after the process that uses them (next to the meta file),
+    so that a build never evicts copies that another build (or its workers) is still reading.
+    pins are released when the build is done, and pins of processes that no longer exist are ignored.
+    """
+
+    def __init__(self, path, max_num_bytes=config.Staging.max_num_bytes, num_threads=config.Staging.num_threads):
+        self.path = path
+        self.max_num_bytes = max_num_bytes
+        self.num_threads = num_threads
+        self.lock = threading.Lock()
+        self.num_copied = 0
+        self.num_reused = 0
+        self.num_evicted = 0
+        self.num_copied_bytes = 0
+        self.num_pending_bytes = 0  # of copies in progress
+        self.pinned = set()  # local paths pinned by this stager
+
+    def stage(self, remote_paths):
+        """
+        yield local copy of each remote path in order, while later paths are copied in the background.
+        copies remain pinned until release() is called.
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        with _lock_dir(self.path):  # pinned copies must not be evicted by other processes between check and use
+            for p in remote_paths:
+                self._pin(self.to_local_path(p))
+        with ThreadPoolExecutor(self.num_threads) as executor:
+            futures = [executor.submit(self._stage_one, p) for p in remote_paths]
+            for future in futures:
+                yield future.result()
+
+    def release(self):
+        """
+        allow copies staged by this stager to be evicted
+        """
+        for local_path in self.pinned:
+            _remove(_to_pin_path(local_path, os.getpid()))
+        self.pinned = set()
+
+    def to_local_path(self, remote_path):
+        return self.path / remote_path.relative_to(config.RemoteDirs.wiki_runs)
+
+    def stats(self):
+        return {'num_copied': self.num_copied,
+                'num_reused': self.num_reused,
+                'num_evicted': self.num_evicted,
+                'num_copied_bytes': self.num_copied_bytes}
+
+    def _pin(self, local_path):
+        local_path.parent.mkdir(parents=True, exist_ok=True)
+        _to_pin_path(local_path, os.getpid()).touch()
+        self.pinned.add(local_path)
+
+    def _stage_one(self, remote_path):
+        local_path = self.to_local_path(remote_path)
+        meta_path = _to_meta_path(local_path)
+        remote_files = stat_files(remote_path)  # the only network access if local copy is fresh
+        meta = _load_meta(meta_path)
+        if meta is not None and local_path.exists() and _is_fresh(meta, remote_files, local_path):
+            print(f'Using staged copy of {remote_path}')
+            with self.lock:
+                self.num_reused += 1
+        else:
+            num_bytes = sum(size for size, mtime in remote_files.values())
+            self._make_room(num_bytes)
+            print(f'Staging {remote_path} ({num_bytes / 1e6} megabytes)')
+            meta = {'remote_path': str(remote_path),
+                    'num_bytes': num_bytes,
+                    'files': _copy(remote_path, local_path, remote_files)}
+            with self.lock:
+                self.num_copied += 1
+                self.num_copied_bytes += num_bytes
+                self.num_pending_bytes -= num_bytes  # now counted by its meta file
+        meta['time_used'] = time.time()
+        save_json(meta_path, meta)
+        return local_path
+
+    def _make_room(self, num_bytes):
+        """
+        remove least-recently used copies that are not pinned by any running process until there is room for num_bytes
+        """
+        with self.lock, _lock_dir(self.path):
+            entries = []
+            for meta_path in self.path.glob('*/*.meta.json'):
+                meta = _load_meta(meta_path)
+                if meta is not None:
+                    entries.append((meta['time_used'], meta['num_bytes'], meta_path))
+            total_num_bytes = sum(n for _, n, _ in entries) + self.num_pending_bytes
+            for _, entry_num_bytes, meta_path in sorted(entries):
+                if total_num_bytes + num_bytes <= self.max_num_bytes:
+                    break
+                local_path = meta_path.parent / meta_path.name[:-len('.meta.json')]
+                if _is_pinned(local_path):
+                    continue
+                print(f'Evicting staged copy {local_path}')
+                _remove(local_path)
+                meta_path.unlink()
+                total_num_bytes -= entry_num_bytes
+                self.num_evicted += 1
+            if total_num_bytes + num_bytes > self.max_num_bytes:
+                print(f'Staged copies exceed quota of {self.max_num_bytes / 1e6} megabytes')
+            self.num_pending_bytes += num_bytes
+
+
+def _to_meta_path(local_path):
+    return local_path.parent / (local_path.name + '.meta.json')
+
+
+def _to_pin_path(local_path, pid):
+    return local_path.parent / f'{local_path.name}.{pid}.pin'
+
+
+def _is_pinned(local_path):
+    """
+    true if a process that is still running uses the copy. pins of processes that no longer exist are removed.
+    """
+    res = False
+    for pin_path in local_path.parent.glob(f'{local_path.name}.*.pin'):
+        pid = pin_path.name[len(local_path.name) + 1: -len('.pin')]
+        if not pid.isdigit():
+            continue
+        if is_process_alive(int(pid)):
+            res = True
+        else:
+            _remove(pin_path)
+    return res
+
+
+@contextmanager
+def _lock_dir(path):
+    """
+    lock shared by all processes that stage into path
+    """
+    with (path / '.lock').open('w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _load_meta(meta_path):
+    try:
+        with meta_path.open('r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _is_fresh(meta, remote_files, local_path):
+    if {name: (f['size'], f['mtime']) for name, f in meta['files'].items()} != remote_files:
+        return False
+    if config.Staging.verify_checksum:
+        local_dir = local_path if local_path.is_dir() else local_path.parent
+        for name, f in meta['files'].items():
+            if _checksum(local_dir / name) != f['sha1']:
+                print(f'Checksum of staged copy {local_dir / name} does not match')
+                return False
+    return True
+
+
+def _checksum(path):
+    sha1 = hashlib.sha1()
+    with path.open('rb') as f:
+        for chunk in iter(lambda: f.read(config.Staging.chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def _copy(remote_path, local_path, remote_files):
+    """
+    copy a shard directory or pickle file, computing a checksum of each file while copying.
+    files are written to a temporary location first, so that readers never see an incomplete copy.
+    """
+    tmp_path = local_path.parent / f'{local_path.name}.{os.getpid()}.{threading.get_ident()}.tmp'
+    is_dir = remote_path.is_dir()
+    if is_dir:
+        tmp_path.mkdir(parents=True)
+    else:
+        tmp_path.parent.mkdir(parents=True, exist_ok=True)
+
+    res = {}
+    for name, (size, mtime) in remote_files.items():
+        src = remote_path / name if is_dir else remote_path
+        dst = tmp_path / name if is_dir else tmp_path
+        sha1 = hashlib.sha1()
+        with src.open('rb') as f_src, dst.open('wb') as f_dst:
+            for chunk in iter(lambda: f_src.read(config.Staging.chunk_size), b''):
+                sha1.update(chunk)
+                f_dst.write(chunk)
+        res[name] = {'size': size, 'mtime': mtime, 'sha1': sha1.hexdigest()}
+
+    _remove(local_path)  # stale copy
+    tmp_path.rename(local_path)
+    return res
+
+
+def _remove(path):
+    if path.is_dir():
+        shutil.rmtree(str(path))
+    elif path.exists():
+        path.unlink()
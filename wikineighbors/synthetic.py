@@ -0,0 +1,54 @@
+import numpy as np
+import pickle
+import yaml
+
+from wikineighbors.file_names import to_w2dfs_file_name
+
+
+def make_synthetic_corpus(wiki_runs, words, num_parts, num_docs_per_part,
+                          doc_size=320, zipf_exponent=1.1, cat='NOUN', first_param_id=1, seed=0):
+    """
+    write a corpus in the layout produced by CreateWikiCorpus on Ludwig:
+    one param_N folder per part, each containing param2val.yaml, job/bodies.txt and w2dfs_<size>_<cat>.pkl.
+    word frequencies follow a Zipf distribution over words (most frequent first),
+    and document sizes are Poisson distributed with mean doc_size.
+    """
+    rng = np.random.default_rng(seed)
+    words = np.asarray(words)
+    probabilities = 1 / np.arange(1, len(words) + 1) ** zipf_exponent
+    probabilities /= probabilities.sum()
+    corpus_size = num_parts * num_docs_per_part
+
+    param_names = []
+    for part in range(num_parts):
+        param_name = f'param_{first_param_id + part}'
+        param_path = wiki_runs / param_name
+        (param_path / 'job').mkdir(parents=True, exist_ok=True)
+        param2val = {'param_name': param_name,
+                     'job_name': f'synthetic_{part}',
+                     'part': part,
+                     'num_machines': num_parts,
+                     'num_docs': corpus_size,
+                     'vocab_size': len(words),
+                     'zipf_exponent': zipf_exponent,
+                     'seed': seed}
+        with (param_path / 'param2val.yaml').open('w') as f:
+            yaml.dump(param2val, f)
+
+        # sample all tokens of part at once, and count them per document
+        doc_sizes = rng.poisson(doc_size, size=num_docs_per_part).clip(min=1)
+        word_ids = rng.choice(len(words), size=doc_sizes.sum(), p=probabilities)
+        doc_ids = np.repeat(np.arange(num_docs_per_part), doc_sizes)
+        with (param_path / 'job' / 'bodies.txt').open('w') as f:
+            for doc_word_ids in np.split(word_ids, np.cumsum(doc_sizes)[:-1]):
+                f.write(' '.join(words[doc_word_ids]) + '\n')
+        keys, counts = np.unique(doc_ids * len(words) + word_ids, return_counts=True)
+        doc_offsets = np.searchsorted(keys // len(words), np.arange(num_docs_per_part + 1))
+        w2dfs = [dict(zip(words[keys[start:stop] % len(words)].tolist(), counts[start:stop].tolist()))
+                 for start, stop in zip(doc_offsets[:-1], doc_offsets[1:])]
+        with (param_path / to_w2dfs_file_name(corpus_size, cat)).open('wb') as f:
+            pickle.dump(w2dfs, f)
+
+        print(f'Wrote {num_docs_per_part} docs with {len(word_ids)} tokens to {param_path}')
+        param_names.append(param_name)
+    return param_names
@@ -1,5 +1,8 @@
 import datetime
+import threading
+import json
 import re
+import os
 from math import log, floor
 
 
@@ -15,6 +18,13 @@ def human_format(number):
     return '%.2f%s' % (number / k**magnitude, units[magnitude])
 
 
+def to_batch_size(num_cols, itemsize=8):
+    """
+    number of rows per batch, so that a batch of similarities with num_cols columns fits into config.Max.batch_num_bytes
+    """
+    return max(1, config.Max.batch_num_bytes // (itemsize * max(1, num_cols)))
+
+
 def to_param_path(param_name):
     return config.RemoteDirs.wiki_runs / param_name
 
@@ -23,10 +33,9 @@ def sort_rows(rows, header, order):
 
     assert header in rows[0]  # make sure that the header is actually in use
 
-    if header == 'Last Modified':
-        print('Sorting using datetime')
+    if header == 'Last modified':  # sort by timestamp rather than by formatted date
         res = sorted(rows,
-                     key=lambda row: datetime.datetime.strptime(row[header], config.Time.format),
+                     key=lambda row: row['mtime'],
                      reverse=True if order == 'descending' else False)
     else:
         res = sorted(rows,
@@ -57,6 +66,44 @@ def gen_100_param_names(corpus_name):
 
 def count_replications(param_name):
     """
-    do not count files like .DS_Store and param2val.yaml
+    do not count files like .DS_Store and param2val.yaml, and converted w2dfs shards
+    """
+    return len([p for p in to_param_path(param_name).glob('[!.]*[!.yaml]')
+                if not p.name.startswith('w2dfs_')])
+
+
+def stat_files(path):
+    """
+    return size and time modified of each file in a shard directory (or of a pickle file)
+    """
+    if path.is_dir():
+        paths = sorted(p for p in path.iterdir() if p.is_file())
+    else:
+        paths = [path]
+    res = {}
+    for p in paths:
+        stat = p.stat()
+        res[p.name] = (stat.st_size, stat.st_mtime)
+    return res
+
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)  # does not kill, only checks that process exists
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # process exists, but belongs to another user
+        pass
+    return True
+
+
+def save_json(path, obj, **kwargs):
+    """
+    write obj to path atomically, so that readers never see an incomplete file.
+    the temporary file is named after process and thread, so that concurrent writers (e.g. workers) never share it.
     """
-    return len(list(to_param_path(param_name).glob('[!.]*[!.yaml]')))
\ No newline at end of file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.parent / f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with tmp_path.open('w') as f:
+        json.dump(obj, f, **kwargs)
+    tmp_path.replace(path)
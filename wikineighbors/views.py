@@ -0,0 +1,441 @@
+from flask import Blueprint, redirect, url_for, jsonify, session, g, stream_with_context, current_app, make_response
+from flask import render_template
+from flask import request
+from werkzeug.local import LocalProxy
+import gzip
+import hashlib
+from timeit import default_timer as timer
+
+import wikineighbors
+from wikineighbors.file_names import get_corpus_size_and_cat
+from wikineighbors.file_names import make_model_dir_name
+from wikineighbors.exceptions import WikiNeighborsNoArticlesFound
+from wikineighbors.exceptions import WikiNeighborsNoVocabFound
+from wikineighbors.exceptions import WikiNeighborsNoMemory
+from wikineighbors.exceptions import WikiNeighborsNoSpecs
+from wikineighbors.exceptions import WikiNeighborsMissingW2Dfs
+from wikineighbors.exceptions import WikiNeighborsIncompatibleModel
+from wikineighbors.io import make_home_data
+from wikineighbors.utils import sort_rows
+from wikineighbors.utils import human_format
+from wikineighbors.corpus import Corpus
+from wikineighbors.jobs import make_build_plan
+from wikineighbors.specs import Specs
+from wikineighbors.metrics import render_metric, render_build_reports
+from wikineighbors.pairs import iter_pairs, stream_pair_sims, format_pair_sims, input_formats, output_formats
+from wikineighbors import config
+
+bp = Blueprint('views', __name__)
+
+# state shared by requests, created by the app factory (see app.py)
+registry = LocalProxy(lambda: current_app.extensions['wikineighbors']['registry'])
+result_cache = LocalProxy(lambda: current_app.extensions['wikineighbors']['result_cache'])
+scheduler = LocalProxy(lambda: current_app.extensions['wikineighbors']['scheduler'])
+request_latency = LocalProxy(lambda: current_app.extensions['wikineighbors']['request_latency'])
+
+
+@bp.app_context_processor
+def inject_topbar_dict():
+    return {'topbar_dict': current_app.config['TOPBAR_DICT']}
+
+
+# ------------------------------------------------ views
+
+@bp.route('/', methods=['GET', 'POST'])
+def home():
+    refresh = bool(request.args.get('refresh'))  # otherwise, metadata is served from local index
+    headers, rows, buttons = make_home_data(refresh)  # returns 1 row per corpus not per param_name
+    # sort
+    if rows:
+        header = request.args.get('header') or config.Default.header
+        order = request.args.get('order') or config.Default.order
+        rows = sort_rows(rows, header, order)
+    else:
+        print('Did not find any corpus data.')
+
+    return render_template('home.html',
+                           title='Wikipedia Corpora',
+                           rows=rows,
+                           buttons=buttons,
+                           headers=headers)
+
+
+@bp.route('/info/<string:corpus_name>', methods=['GET', 'POST'])
+def info(corpus_name):
+    corpus = Corpus(corpus_name)
+
+    return render_template('info.html',
+                           corpus_name=corpus_name,
+                           num_param_names=corpus.num_param_names,
+                           paths_to_txt_files=corpus.txt_paths
+                           )
+
+
+@bp.route('/query/<string:corpus_name>', methods=['GET', 'POST'])
+def query(corpus_name):
+
+    if not session.get(corpus_name):
+        raise WikiNeighborsNoSpecs(corpus_name)
+
+    if request.args.get('reset'):
+        session['error_messages'] = []
+        session['words'] = []  # don't autofill fields with user's previous words
+
+    if not session.get('error_messages', []):
+        error_message = ''
+        fields = [(config.Default.word, error_message)
+                  for _ in range(config.Max.num_fields)]
+    else:
+        fields = [(word, error_message)
+                  for word, error_message in zip(session['words'], session['error_messages'])]
+
+    return render_template('query.html',
+                           corpus_name=corpus_name,
+                           fields=fields,
+                           )
+
+
+@bp.route('/build/<string:corpus_name>', methods=['GET', 'POST'])
+def build(corpus_name):
+    corpus = Corpus(corpus_name)
+
+    return render_template('build.html',
+                           corpus_name=corpus_name,
+                           vocab_sizes=config.Sims.vocab_sizes,
+                           w2dfs_names=corpus.w2dfs_names,
+                           cached_vocab_names=corpus.cached_vocab_names,
+                           jobs=[job.to_dict() for job in scheduler.get_jobs(corpus_name)],
+                           poll_interval=config.Jobs.poll_interval,
+                           strict_planner=config.Planner.strict,
+                           )
+
+
+@bp.route('/neighbors/<string:corpus_name>', methods=['GET', 'POST'])
+def neighbors(corpus_name):
+    start = timer()
+    corpus = Corpus(corpus_name)
+    responder = registry.get_from_session(session, corpus)
+
+    valid_words = session['validated_words']
+
+    # respond with 304 before computing anything if client already has the page
+    etag = make_neighbors_etag(responder, valid_words)
+    if request.method == 'GET' and etag in request.if_none_match:
+        return make_conditional_response(current_app.response_class(), etag)
+
+    results = [(word, result_cache.get_top_neighbors(responder, word, config.Max.num_neighbors))
+               for word in valid_words]
+
+    # filtered sim table (sims between all word pairs)
+    filtered_sims = result_cache.get_sims_block(responder, valid_words)
+
+    elapsed = timer() - start
+    response = make_response(render_template('neighbors.html',
+                                             corpus_name=corpus_name,
+                                             words=valid_words,
+                                             results=results,
+                                             filtered_sims=filtered_sims,
+                                             num_svd_dims=config.Sims.num_svd_dimensions,
+                                             num_words=human_format(responder.specs.vocab_size),
+                                             num_docs=human_format(responder.specs.corpus_size),
+                                             elapsed=elapsed
+                                             ))
+    return make_conditional_response(response, etag)
+
+# ----------------------------------------------- non-views
+
+
+@bp.before_app_request
+def start_timer():
+    g.start_time = timer()
+
+
+@bp.after_app_request
+def record_latency(response):
+    if request.endpoint in config.Metrics.timed_endpoints:
+        request_latency.observe(request.endpoint, timer() - g.start_time)
+    return response
+
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    request latencies, model registry and result cache counters, and the most recent build report of each model,
+    in the Prometheus text exposition format
+    """
+    lines = request_latency.render()
+    for name, value in registry.stats().items():
+        if isinstance(value, int):
+            lines += render_metric(f'wikineighbors_model_registry_{name}', f'Model registry {name}',
+                                   'gauge', [({}, value)])
+    for name, value in result_cache.stats().items():
+        if isinstance(value, int):
+            lines += render_metric(f'wikineighbors_result_cache_{name}', f'Result cache {name}',
+                                   'gauge', [({}, value)])
+    lines += render_build_reports(config.LocalDirs.cache.glob('*/*.report.json'))
+    return current_app.response_class('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+@bp.route('/autocomplete/<string:corpus_name>', methods=['GET'])
+def autocomplete(corpus_name):
+    corpus = Corpus(corpus_name)
+    responder = registry.get_from_session(session, corpus)
+    prefix = request.args.get('prefix', '')
+    limit = request.args.get('limit', config.Max.num_completions, type=int)
+    limit = max(0, min(limit, config.Max.num_completions))  # never more than the suggestions shown while typing
+    return make_cacheable_json_response(json_list=responder.vocab.complete(prefix, limit))
+
+
+def make_neighbors_etag(responder, words):
+    """
+    page only changes if model is re-built or other words are queried
+    """
+    key = [wikineighbors.__version__, responder.corpus.name, make_model_dir_name(responder.specs),
+           responder.time_modified] + list(words)
+    return hashlib.sha1('\n'.join(map(str, key)).encode()).hexdigest()
+
+
+def make_conditional_response(response, etag):
+    response.set_etag(etag)
+    response.vary.add('Cookie')  # page depends on vocab and words selected in session
+    response.cache_control.no_cache = True  # client must re-validate with ETag before using cached page
+    return response.make_conditional(request)
+
+
+def make_cacheable_json_response(**kwargs):
+    """
+    gzip response if client accepts it, and respond with 304 if client already has the same response
+    """
+    response = jsonify(**kwargs)
+    if request.accept_encodings['gzip']:
+        response.set_data(gzip.compress(response.get_data(), mtime=0))  # mtime=0, so that ETag is stable
+        response.headers['Content-Encoding'] = 'gzip'
+    response.add_etag()  # of encoded body, so that gzip and identity bodies have different ETags
+    response.vary.update(['Accept-Encoding', 'Cookie'])  # response depends on vocab selected in session
+    response.cache_control.no_cache = True  # client must re-validate with ETag before using cached response
+    return response.make_conditional(request)
+
+
+@bp.route('/validate/<string:corpus_name>', methods=['GET', 'POST'])
+def validate(corpus_name):
+    corpus = Corpus(corpus_name)
+    responder = registry.get_from_session(session, corpus)
+    err_message = 'Not in vocab'
+
+    words = session['words'] = request.args.getlist('word')
+    session['validated_words'] = []
+    session['error_messages'] = []
+    for n, word in enumerate(words):
+        if word == config.Default.word:
+            session['error_messages'].append('')
+        elif word not in responder.vocab:
+            session['error_messages'].append(err_message)
+        else:
+            session['error_messages'].append('')
+            session['validated_words'].append(word)
+
+    if err_message in session['error_messages']:
+        return redirect(url_for('.query', corpus_name=corpus_name))
+    else:
+        return redirect(url_for('.neighbors', corpus_name=corpus_name))
+
+
+@bp.route('/api/neighbors/<string:corpus_name>', methods=['GET', 'POST'])
+def api_neighbors(corpus_name):
+    """
+    stateless alternative to the query form.
+    accepts specs, words and k as query string (word=...&word=...) or as JSON body (words=[...]).
+    """
+    if request.is_json:
+        params = request.get_json(silent=True)  # None if body is not valid JSON
+        if not isinstance(params, dict):
+            return jsonify(error='JSON body must be an object'), 400
+        words = params.get('words', [])
+        if not isinstance(words, list) or not all(isinstance(w, str) for w in words):
+            return jsonify(error='words must be a list of strings'), 400
+    else:
+        params = request.args
+        words = params.getlist('word')
+    try:
+        specs = Specs(vocab_size=params['vocab_size'], corpus_size=params['corpus_size'], cat=params['cat'])
+        k = int(params.get('k', config.Max.num_neighbors))
+    except (KeyError, ValueError, TypeError):
+        return jsonify(error='Must specify vocab_size, corpus_size and cat, and k must be an integer'), 400
+
+    responder = registry.get(Corpus(corpus_name), specs)
+    if responder.time_modified is None:
+        return jsonify(error='Model {} was not built for {}'.format(make_model_dir_name(specs), corpus_name)), 404
+
+    valid_words = [w for w in words if w in responder.vocab]
+    neighbors, sims = responder.get_top_neighbors_batch(valid_words, k)
+    return jsonify(corpus_name=corpus_name,
+                   vocab_name=make_model_dir_name(specs),
+                   k=neighbors.shape[1],
+                   words=valid_words,
+                   oov=[w for w in words if w not in responder.vocab],
+                   neighbors=neighbors.tolist(),
+                   neighbor_sims=sims.tolist(),
+                   sims=responder.get_sims_block(valid_words).tolist())
+
+
+@bp.route('/api/sims/<string:corpus_name>', methods=['POST'])
+def api_sims(corpus_name):
+    """
+    similarities of many word pairs, streamed back while they are computed.
+    accepts a request body with one pair (or list) of words per line,
+    either tab-separated (input_format=tsv) or as JSON (input_format=ndjson).
+    responds with one result per line (output_format=ndjson) or with CSV (output_format=csv).
+    """
+    params = request.args
+    try:
+        specs = Specs(vocab_size=params['vocab_size'], corpus_size=params['corpus_size'], cat=params['cat'])
+    except (KeyError, ValueError, TypeError):
+        return jsonify(error='Must specify vocab_size, corpus_size and cat'), 400
+    input_format = params.get('input_format', 'tsv')
+    output_format = params.get('output_format', 'ndjson')
+    if input_format not in input_formats or output_format not in output_formats:
+        return jsonify(error='input_format must be one of {} and output_format one of {}'.format(
+            input_formats, output_formats)), 400
+
+    responder = registry.get(Corpus(corpus_name), specs)
+    if responder.time_modified is None:
+        return jsonify(error='Model {} was not built for {}'.format(make_model_dir_name(specs), corpus_name)), 404
+
+    # body is read while results are sent, so neither input nor output is held in memory.
+    # body is not parsed as form data (e.g. multipart), because uploaded files are closed before streaming starts
+    batches = stream_pair_sims(responder, iter_pairs(request.stream, input_format))
+    mimetype = 'application/x-ndjson' if output_format == 'ndjson' else 'text/csv'
+    return current_app.response_class(stream_with_context(format_pair_sims(batches, output_format)), mimetype=mimetype)
+
+
+@bp.route('/model_registry', methods=['GET'])
+def model_registry():
+    return jsonify(registry.stats())
+
+
+def get_build_args():
+    """
+    return specs and vocab sizes of a submitted build, or None if submission is incomplete
+    """
+    vocab_size = request.args.get('vocab_size')
+    w2dfs_name = request.args.get('w2dfs_name')
+
+    # validation
+    if not vocab_size or not w2dfs_name:
+        return None
+
+    # build all vocab sizes from a single term-by-doc matrix for the largest vocab size
+    if vocab_size == 'all':
+        vocab_sizes = config.Sims.vocab_sizes
+        vocab_size = max(vocab_sizes)
+    else:
+        vocab_sizes = None
+
+    corpus_size, cat = get_corpus_size_and_cat(w2dfs_name)
+    specs = Specs(vocab_size=vocab_size, corpus_size=corpus_size, cat=cat)
+    return specs, vocab_sizes
+
+
+@bp.route('/build_plan/<string:corpus_name>', methods=['GET'])
+def build_plan(corpus_name):
+    """
+    estimated memory and chosen strategy of a build, shown before the build is submitted
+    """
+    build_args = get_build_args()
+    if build_args is None:
+        return jsonify(error='Must specify vocab_size and w2dfs_name'), 400
+    plan = make_build_plan(corpus_name, *build_args)
+    return jsonify(plan.to_dict())
+
+
+@bp.route('/cache_sims/<string:corpus_name>', methods=['GET', 'POST'])
+def cache_sims(corpus_name):
+
+    build_args = get_build_args()
+    if build_args is None:
+        return render_template('error.html',
+                               message='Incomplete submission',
+                               status_code=500)
+
+    specs, vocab_sizes = build_args
+    job = scheduler.submit(corpus_name, specs, vocab_sizes)  # builds in separate process - saves vocab + embeddings
+    return redirect(url_for('.build', corpus_name=corpus_name, job_id=job.job_id))
+
+
+@bp.route('/build_status/<string:job_id>', methods=['GET'])
+def build_status(job_id):
+    job = scheduler.get(job_id)
+    if job is None:
+        return jsonify(error='Unknown job {}'.format(job_id)), 404
+    return jsonify(job.to_dict())
+
+
+@bp.route('/load_vocab/<string:corpus_name>', methods=['GET', 'POST'])
+def load_vocab(corpus_name):
+
+    vocab_name = request.args.get('vocab_name')
+    if not vocab_name:
+        return render_template('error.html',
+                               message='Incomplete submission',
+                               status_code=500)
+
+    session[corpus_name] = vocab_name
+    return redirect(url_for('.build', corpus_name=corpus_name))
+
+# -------------------------------------------- error handling
+
+
+@bp.app_errorhandler(WikiNeighborsNoArticlesFound)
+def handler(exception):
+    return render_template('error.html',
+                           message=exception.message,
+                           status_code=500)
+
+
+@bp.app_errorhandler(WikiNeighborsNoVocabFound)
+def handler(exception):
+    return render_template('error.html',
+                           message=exception.message,
+                           status_code=500)
+
+
+@bp.app_errorhandler(WikiNeighborsNoMemory)
+def handler(exception):
+    return render_template('error.html',
+                           message=exception.message,
+                           status_code=500)
+
+
+@bp.app_errorhandler(WikiNeighborsNoSpecs)
+def handler(exception):
+    return render_template('error.html',
+                           message=exception.message,
+                           status_code=500)
+
+
+@bp.app_errorhandler(WikiNeighborsMissingW2Dfs)
+def handler(exception):
+    return render_template('error.html',
+                           message=exception.message,
+                           status_code=500)
+
+
+@bp.app_errorhandler(WikiNeighborsIncompatibleModel)
+def handler(exception):
+    return render_template('error.html',
+                           message=exception.message,
+                           status_code=500)
+
+
+@bp.app_errorhandler(500)
+def handle_app_error(exception):
+    return render_template('error.html',
+                           message=exception,
+                           status_code=500)
+
+
+@bp.app_errorhandler(404)
+def page_not_found(exception):
+    return render_template('error.html',
+                           message=exception,
+                           status_code=404)
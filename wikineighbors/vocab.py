@@ -0,0 +1,123 @@
+import numpy as np
+
+FNV_OFFSET = 0xcbf29ce484222325
+FNV_PRIME = 0x100000001b3
+MASK_64 = 0xffffffffffffffff
+
+
+class Vocab:
+    """
+    a vocabulary stored in contiguous arrays, which are saved with a model and can be memory-mapped.
+
+    words: string table, ordered by corpus frequency
+    counts: corpus frequency of each word
+    sorted_ids: ids of words in alphabetical order, for prefix search and vectorized lookup
+    hash_table: open-addressing hash table mapping hash of word to id (-1 if slot is empty), for O(1) lookup
+    """
+
+    array_names = ('vocab', 'vocab_counts', 'vocab_sorted_ids', 'vocab_hash_table')
+
+    def __init__(self, words, counts, sorted_ids, hash_table):
+        self.words = words
+        self.counts = counts
+        self.sorted_ids = sorted_ids
+        self.hash_table = hash_table
+
+    @classmethod
+    def build(cls, words, counts):
+        words = np.asarray(words)
+        counts = np.asarray(counts, dtype=np.int64)
+        sorted_ids = np.argsort(words, kind='stable').astype(np.int32)
+
+        # table is at most half full, so that probing sequences are short
+        num_slots = 1 << int(2 * max(len(words), 1) - 1).bit_length()
+        hash_table = np.full(num_slots, -1, dtype=np.int32)
+        for word_id, h in enumerate(_hash_words(words).tolist()):
+            slot = h & (num_slots - 1)
+            while hash_table[slot] != -1:
+                slot = (slot + 1) & (num_slots - 1)
+            hash_table[slot] = word_id
+        return cls(words, counts, sorted_ids, hash_table)
+
+    def to_arrays(self):
+        return dict(zip(self.array_names, [self.words, self.counts, self.sorted_ids, self.hash_table]))
+
+    @property
+    def num_bytes(self):
+        return self.words.nbytes + self.counts.nbytes + self.sorted_ids.nbytes + self.hash_table.nbytes
+
+    def __len__(self):
+        return len(self.words)
+
+    def __getitem__(self, ids):
+        return self.words[ids]
+
+    def __contains__(self, word):
+        return self.get(word) is not None
+
+    def get(self, word, default=None):
+        """
+        return id of word, or default if word is not in vocab
+        """
+        num_slots = len(self.hash_table)
+        slot = _hash_word(word) & (num_slots - 1)
+        while True:
+            word_id = self.hash_table[slot]
+            if word_id == -1:
+                return default
+            if self.words[word_id] == word:
+                return int(word_id)
+            slot = (slot + 1) & (num_slots - 1)
+
+    def index(self, word):
+        res = self.get(word)
+        if res is None:
+            raise KeyError(word)
+        return res
+
+    def lookup(self, words):
+        """
+        return ids of many words at once (-1 for words not in vocab), without creating Python objects per word
+        """
+        words = np.asarray(words, dtype=str)
+        if len(self.words) == 0:
+            return np.full(len(words), -1)
+        positions = np.searchsorted(self.words, words, sorter=self.sorted_ids).clip(max=len(self.words) - 1)
+        ids = self.sorted_ids[positions]
+        return np.where(self.words[ids] == words, ids, -1)
+
+    def complete(self, prefix, limit):
+        """
+        return up to limit words starting with prefix, most frequent first.
+        words with the same prefix are adjacent in alphabetical order, and are found by binary search.
+        """
+        start = np.searchsorted(self.words, prefix, side='left', sorter=self.sorted_ids)
+        stop = np.searchsorted(self.words, prefix + chr(0x10FFFF), side='left', sorter=self.sorted_ids)
+        ids = self.sorted_ids[start:stop]
+        ids = ids[np.argsort(-self.counts[ids], kind='stable')][:limit]
+        return self.words[ids].tolist()
+
+
+def _hash_word(word):
+    """
+    64-bit FNV-1a hash of the code points of a word
+    """
+    h = FNV_OFFSET
+    for c in word:
+        h = ((h ^ ord(c)) * FNV_PRIME) & MASK_64
+    return h
+
+
+def _hash_words(words):
+    """
+    vectorized version of _hash_word for an array of strings
+    """
+    words = np.ascontiguousarray(words)
+    if len(words) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    code_points = words.view(np.uint32).reshape(len(words), -1).astype(np.uint64)
+    res = np.full(len(words), FNV_OFFSET, dtype=np.uint64)
+    for column in code_points.T:
+        is_char = column != 0  # strings shorter than the array's item size are padded with zeros
+        res = np.where(is_char, (res ^ column) * np.uint64(FNV_PRIME), res)
+    return res
@@ -0,0 +1,5 @@
+from app import create_app
+
+# entry point for other WSGI servers, e.g. gunicorn wsgi:app.
+# set WIKINEIGHBORS_LUDWIG_DATA if Wiki data is not mounted, e.g. to /mnt/md0/ludwig_data on s76
+app = create_app()